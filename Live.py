@@ -3,13 +3,20 @@ import streamlit as st
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
 from utils.loader import *
+from utils.alerts import DEFAULT_RULES, fresh_state, window_periods
+from utils.events import threshold_periods
+from utils.downsample import MAX_POINTS, decimate
+from utils.render import cached_figure
+from utils.rolling import WINDOWS
+from utils.profiling import end_run, plotly_chart, stage, start_run
 
 st.set_page_config(layout="wide", page_icon='random')
+start_run('Live')
 
 # Assuming df is already loaded and contains the data
 
-with st.spinner('Loading data...'):
-    df = load_data()
+with st.spinner('Loading data...'), stage('load'):
+    dataset = load_latest_dataset()
 
 # Replace fill values with NaN for proper handling
 
@@ -18,6 +25,7 @@ st.title('🪨 Solar Wind Parameters and Geomagnetic Indices Report')
 # Time range selection
 st.sidebar.title('Select Time Range')
 time_range = st.sidebar.selectbox('Time Range', ['Last Few Hours', 'Last 1 Day', 'Last Week'])
+rolling_window = st.sidebar.selectbox('Rolling Mean', ['Off', *WINDOWS])
 
 now = datetime.now()
 now = datetime.now() - timedelta(days=30)  # Remove this line or comment it out
@@ -30,44 +38,67 @@ elif time_range == 'Last 1 Day':
 elif time_range == 'Last Week':
     start_time = now - timedelta(weeks=1)
 
-df_time_filtered = df[(df['datetime'] >= start_time) & (df['datetime'] <= now)]
+with stage('filter') as entry:
+    window_rows = dataset.index.slice(start_time, now)
+    df_time_filtered = dataset.frame(rows=window_rows)
+    if entry is not None:
+        entry['rows'] = len(df_time_filtered)
 
 st.write(f"**Showing data from {start_time.strftime('%Y-%m-%d %H:%M:%S')} to {now.strftime('%Y-%m-%d %H:%M:%S')}**")
 
-# Define thresholds
-bz_threshold = -5  # nT
-speed_threshold = 500  # km/s
-density_threshold = 10  # N/cm³
-dst_threshold = -50  # nT
+# Define thresholds (shared with the alert daemon, utils/alerts.py)
+bz_threshold = DEFAULT_RULES['bz'][2]  # nT
+speed_threshold = DEFAULT_RULES['speed'][2]  # km/s
+density_threshold = DEFAULT_RULES['density'][2]  # N/cm³
+dst_threshold = DEFAULT_RULES['dst'][2]  # nT
+
+
+def decimated(column):
+    # Cap the points sent to the browser; min/max buckets keep storm spikes visible
+    x, y = decimate(df_time_filtered['datetime'], df_time_filtered[column])
+    return dict(x=x, y=y)
+
+
+def line_figure(column, name, color, title, yaxis_title, threshold=None, mode='lines'):
+    # Built once per data version and window and shared by every session
+    def build():
+        fig = go.Figure()
+        fig.add_trace(go.Scattergl(**decimated(column), mode=mode, name=name, line=dict(color=color)))
+        if rolling_window != 'Off':
+            # Mean over the trailing window on the gap-free hourly grid
+            with stage(f'rolling:{column}'):
+                rolling = latest_rolling().get(dataset, column, WINDOWS[rolling_window])
+                hours = rolling.slice(start_time, now)
+                x, y = decimate(rolling.times(hours), rolling.values('mean')[hours])
+            fig.add_trace(go.Scattergl(x=x, y=y, mode='lines', name=f'{rolling_window} mean', line=dict(color='white', dash='dot')))
+        if threshold is not None:
+            fig.add_hline(y=threshold, line=dict(color='red', dash='dash'), annotation_text='Threshold')
+        fig.update_layout(title=title, xaxis_title='Time', yaxis_title=yaxis_title, template='plotly_dark')
+        return fig
+
+    key = (dataset.version, column, (window_rows.start, window_rows.stop), MAX_POINTS, rolling_window)
+    return cached_figure(key, build)
+
 
 # Plotting IMF Bz (GSM)
 st.subheader('Interplanetary Magnetic Field Bz (GSM)')
 
-fig_bz = go.Figure()
-fig_bz.add_trace(go.Scatter(x=df_time_filtered['datetime'], y=df_time_filtered['bz_gsm'], mode='lines', name='Bz GSM', line=dict(color='blue')))
-fig_bz.add_trace(go.Scatter(x=df_time_filtered['datetime'], y=[bz_threshold]*len(df_time_filtered), mode='lines', name='Threshold', line=dict(color='red', dash='dash')))
-fig_bz.update_layout(title='IMF Bz (GSM)', xaxis_title='Time', yaxis_title='Bz (nT)', template='plotly_dark')
-st.plotly_chart(fig_bz, use_container_width=True)
+fig_bz = line_figure('bz_gsm', 'Bz GSM', 'blue', 'IMF Bz (GSM)', 'Bz (nT)', bz_threshold)
+plotly_chart(fig_bz, 'bz', use_container_width=True)
 st.write("The **IMF Bz** (Interplanetary Magnetic Field Bz component) is crucial for space weather. When it's southward, especially below **-5 nT**, it can connect with the Earth's magnetic field, potentially leading to geomagnetic storms.")
 
 # Plotting Solar Wind Speed
 st.subheader('Solar Wind Speed')
 
-fig_speed = go.Figure()
-fig_speed.add_trace(go.Scatter(x=df_time_filtered['datetime'], y=df_time_filtered['plasma_speed'], mode='lines', name='Solar Wind Speed', line=dict(color='green')))
-fig_speed.add_trace(go.Scatter(x=df_time_filtered['datetime'], y=[speed_threshold]*len(df_time_filtered), mode='lines', name='Threshold', line=dict(color='red', dash='dash')))
-fig_speed.update_layout(title='Solar Wind Speed', xaxis_title='Time', yaxis_title='Speed (km/s)', template='plotly_dark')
-st.plotly_chart(fig_speed, use_container_width=True)
+fig_speed = line_figure('plasma_speed', 'Solar Wind Speed', 'green', 'Solar Wind Speed', 'Speed (km/s)', speed_threshold)
+plotly_chart(fig_speed, 'speed', use_container_width=True)
 st.write("**Solar Wind Speed** above **500 km/s** can enhance the interaction with Earth's magnetosphere, potentially leading to increased geomagnetic activity.")
 
 # Plotting Proton Density
 st.subheader('Proton Density')
 
-fig_density = go.Figure()
-fig_density.add_trace(go.Scatter(x=df_time_filtered['datetime'], y=df_time_filtered['proton_density'], mode='lines', name='Proton Density', line=dict(color='orange')))
-fig_density.add_trace(go.Scatter(x=df_time_filtered['datetime'], y=[density_threshold]*len(df_time_filtered), mode='lines', name='Threshold', line=dict(color='red', dash='dash')))
-fig_density.update_layout(title='Proton Density', xaxis_title='Time', yaxis_title='Density (N/cm³)', template='plotly_dark')
-st.plotly_chart(fig_density, use_container_width=True)
+fig_density = line_figure('proton_density', 'Proton Density', 'orange', 'Proton Density', 'Density (N/cm³)', density_threshold)
+plotly_chart(fig_density, 'density', use_container_width=True)
 st.write("High **Proton Density** over **10 N/cm³** can intensify space weather effects, impacting satellite operations and communications.")
 
 # Geomagnetic Indices
@@ -77,19 +108,14 @@ col1, col2 = st.columns(2)
 
 with col1:
     st.write('**Dst Index**')
-    fig_dst = go.Figure()
-    fig_dst.add_trace(go.Scatter(x=df_time_filtered['datetime'], y=df_time_filtered['dst_index'], mode='lines', name='Dst Index', line=dict(color='purple')))
-    fig_dst.add_trace(go.Scatter(x=df_time_filtered['datetime'], y=[dst_threshold]*len(df_time_filtered), mode='lines', name='Threshold', line=dict(color='red', dash='dash')))
-    fig_dst.update_layout(title='Dst Index', xaxis_title='Time', yaxis_title='Dst (nT)', template='plotly_dark')
-    st.plotly_chart(fig_dst, use_container_width=True)
+    fig_dst = line_figure('dst_index', 'Dst Index', 'purple', 'Dst Index', 'Dst (nT)', dst_threshold)
+    plotly_chart(fig_dst, 'dst', use_container_width=True)
     st.write("The **Dst Index** measures global geomagnetic storm activity. Values below **-50 nT** indicate storm-level disturbances, affecting navigation systems and power grids.")
 
 with col2:
     st.write('**Kp Index**')
-    fig_kp = go.Figure()
-    fig_kp.add_trace(go.Scatter(x=df_time_filtered['datetime'], y=df_time_filtered['kp'], mode='lines+markers', name='Kp Index', line=dict(color='cyan')))
-    fig_kp.update_layout(title='Kp Index', xaxis_title='Time', yaxis_title='Kp', template='plotly_dark')
-    st.plotly_chart(fig_kp, use_container_width=True)
+    fig_kp = line_figure('kp', 'Kp Index', 'cyan', 'Kp Index', 'Kp', mode='lines+markers')
+    plotly_chart(fig_kp, 'kp', use_container_width=True)
     st.write("The **Kp Index** quantifies geomagnetic activity. Higher values indicate more intense geomagnetic storms, which can affect power systems and satellite operations.")
 
 # Electric Field and Flow Pressure
@@ -99,58 +125,42 @@ col3, col4 = st.columns(2)
 
 with col3:
     st.write('**Electric Field**')
-    fig_efield = go.Figure()
-    fig_efield.add_trace(go.Scatter(x=df_time_filtered['datetime'], y=df_time_filtered['electric_field'], mode='lines', name='Electric Field', line=dict(color='magenta')))
-    fig_efield.update_layout(title='Electric Field', xaxis_title='Time', yaxis_title='E (mV/m)', template='plotly_dark')
-    st.plotly_chart(fig_efield, use_container_width=True)
+    fig_efield = line_figure('electric_field', 'Electric Field', 'magenta', 'Electric Field', 'E (mV/m)')
+    plotly_chart(fig_efield, 'efield', use_container_width=True)
     st.write("The **Electric Field** affects charged particles in the solar wind. Large electric field magnitudes can enhance geomagnetic activity and radio signal disruptions.")
 
 with col4:
     st.write('**Flow Pressure**')
-    fig_pressure = go.Figure()
-    fig_pressure.add_trace(go.Scatter(x=df_time_filtered['datetime'], y=df_time_filtered['flow_pressure'], mode='lines', name='Flow Pressure', line=dict(color='yellow')))
-    fig_pressure.update_layout(title='Flow Pressure', xaxis_title='Time', yaxis_title='Pressure (nPa)', template='plotly_dark')
-    st.plotly_chart(fig_pressure, use_container_width=True)
+    fig_pressure = line_figure('flow_pressure', 'Flow Pressure', 'yellow', 'Flow Pressure', 'Pressure (nPa)')
+    plotly_chart(fig_pressure, 'pressure', use_container_width=True)
     st.write("**Flow Pressure** is influenced by solar wind density and speed. High flow pressure can compress Earth's magnetosphere, impacting space weather conditions.")
 
 # AE Index
 st.subheader('AE Index')
 
-fig_ae = go.Figure()
-fig_ae.add_trace(go.Scatter(x=df_time_filtered['datetime'], y=df_time_filtered['ae_index'], mode='lines', name='AE Index', line=dict(color='lightgreen')))
-fig_ae.update_layout(title='AE Index', xaxis_title='Time', yaxis_title='AE (nT)', template='plotly_dark')
-st.plotly_chart(fig_ae, use_container_width=True)
+fig_ae = line_figure('ae_index', 'AE Index', 'lightgreen', 'AE Index', 'AE (nT)')
+plotly_chart(fig_ae, 'ae', use_container_width=True)
 st.write("The **AE Index** measures auroral electrojet activity, reflecting ionospheric currents. High AE values can indicate increased ionospheric disturbances.")
 
 # Summary and Alerts
 st.subheader('Summary')
 
 alert_messages = []
+alert_state = fresh_state(dataset)
+
+
+def alert_periods(name):
+    # Read the periods off the alert daemon's state; recompute them over the
+    # window only when the daemon isn't running or is behind.
+    if alert_state is not None:
+        return window_periods(alert_state, name, dataset, start_time, now)
+    column, condition, threshold = DEFAULT_RULES[name]
+    return threshold_periods(df_time_filtered, column, threshold, condition=condition)
 
-def get_threshold_periods(df, column, threshold, condition='less'):
-    if condition == 'less':
-        condition_met = df[column] < threshold
-    elif condition == 'greater':
-        condition_met = df[column] > threshold
-    else:
-        raise ValueError("Condition must be 'less' or 'greater'")
-    periods = []
-    start_time = None
-    for i in range(len(condition_met)):
-        if condition_met.iloc[i]:
-            if start_time is None:
-                start_time = df['datetime'].iloc[i]
-            end_time = df['datetime'].iloc[i]
-        else:
-            if start_time is not None:
-                periods.append((start_time, end_time))
-                start_time = None
-    if start_time is not None:
-        periods.append((start_time, end_time))
-    return periods
 
 # IMF Bz
-bz_periods = get_threshold_periods(df_time_filtered, 'bz_gsm', bz_threshold, condition='less')
+with stage('events:bz'):
+    bz_periods = alert_periods('bz')
 if bz_periods:
     alert_messages.append(f"**IMF Bz** was southward and below threshold ({bz_threshold} nT) during the following periods:")
     for period in bz_periods:
@@ -159,7 +169,8 @@ if bz_periods:
         alert_messages.append(f"- From {start_str} to {end_str}")
 
 # Solar Wind Speed
-speed_periods = get_threshold_periods(df_time_filtered, 'plasma_speed', speed_threshold, condition='greater')
+with stage('events:speed'):
+    speed_periods = alert_periods('speed')
 if speed_periods:
     alert_messages.append(f"**Solar Wind Speed** was high and above threshold ({speed_threshold} km/s) during the following periods:")
     for period in speed_periods:
@@ -168,7 +179,8 @@ if speed_periods:
         alert_messages.append(f"- From {start_str} to {end_str}")
 
 # Proton Density
-density_periods = get_threshold_periods(df_time_filtered, 'proton_density', density_threshold, condition='greater')
+with stage('events:density'):
+    density_periods = alert_periods('density')
 if density_periods:
     alert_messages.append(f"**Proton Density** was high and above threshold ({density_threshold} N/cm³) during the following periods:")
     for period in density_periods:
@@ -177,7 +189,8 @@ if density_periods:
         alert_messages.append(f"- From {start_str} to {end_str}")
 
 # Dst Index
-dst_periods = get_threshold_periods(df_time_filtered, 'dst_index', dst_threshold, condition='less')
+with stage('events:dst'):
+    dst_periods = alert_periods('dst')
 if dst_periods:
     alert_messages.append(f"**Dst Index** indicated geomagnetic storm conditions (below {dst_threshold} nT) during the following periods:")
     for period in dst_periods:
@@ -191,4 +204,6 @@ if alert_messages:
         ms += msg + '\n\n'
     st.error(ms)
 else:
-    st.success('✅ No alerts. Solar parameters are within normal ranges.')
\ No newline at end of file
+    st.success('✅ No alerts. Solar parameters are within normal ranges.')
+
+end_run()
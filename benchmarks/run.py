@@ -0,0 +1,256 @@
+"""Benchmark the data pipeline on synthetic OMNI data.
+
+Generates ``--years`` of hourly data (60 years is roughly the real
+here.dat; ``--scale 10`` makes it ten times longer), then times every
+pipeline stage and records its peak traced allocation (from a second,
+traced run, so tracing doesn't slow the timed one), the process peak RSS
+and, for figures, the serialized payload size. Each run is appended to
+benchmarks/history.json with the current commit so runs can be compared.
+
+    python -m benchmarks.run --scale 1
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+from benchmarks import synth
+from utils import forecast
+from utils.correlation import PairStats
+from utils.downsample import decimate
+from utils.events import threshold_periods
+from utils.loader import CACHE_DIR, SCHEMA, build_cache, cols, load_dataset
+from utils.rolling import WINDOWS, RollingWindow, hourly
+from utils.rollup import Rollup
+
+HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history.json')
+PARAMETERS = ['bz_gsm', 'plasma_speed', 'proton_density', 'dst_index', 'kp', 'ae_index']
+
+
+def _max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return rss / 2 ** 20 if sys.platform == 'darwin' else rss / 2 ** 10
+
+
+class Recorder:
+    def __init__(self):
+        self.stages = {}
+
+    def stage(self, name, func, *args, rows=None, setup=None):
+        """Time ``func(*args)``, then run it again traced for its peak allocation.
+
+        Tracing slows every allocation, so the timed run is untraced.
+        ``setup()``, if given, puts back the state the stage starts from
+        before each run.
+        """
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = func(*args)
+        seconds = time.perf_counter() - start
+        if setup:
+            setup()
+        tracemalloc.start()
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stages[name] = {
+            'seconds': round(seconds, 6),
+            'peak_alloc_mb': round(peak / 2 ** 20, 3),
+            'max_rss_mb': round(_max_rss_mb(), 1),
+        }
+        if rows is not None:
+            self.stages[name]['rows'] = rows
+        print(f'{name:<22} {seconds:10.4f} s {peak / 2 ** 20:10.1f} MB')
+        return result
+
+    def payload(self, name, fig):
+        self.stages[name]['payload_bytes'] = len(fig.to_json())
+
+
+def legacy_parse(path):
+    # What utils/loader.py did before the columnar cache
+    df = pd.read_csv(path, sep=r'\s+', header=None, names=cols)
+    df['datetime'] = pd.to_datetime(df['year'].astype(str) + ' ' + df['day'].astype(str) + ' ' + df['hour'].astype(str), format='%Y %j %H')
+    return df.dropna()
+
+
+def legacy_monthly_groupby(dataset):
+    df = dataset.frame(['datetime', 'bz_gsm'])
+    return df.groupby([df['datetime'].dt.year, df['datetime'].dt.month])['bz_gsm'].mean()
+
+
+def rollup_heatmap(rollup):
+    monthly = rollup.frame('month', 'bz_gsm').pivot(index='year', columns='month', values='bz_gsm')
+    return px.imshow(monthly, color_continuous_scale='Viridis', aspect='auto')
+
+
+def detect_events(frame):
+    return [
+        threshold_periods(frame, 'bz_gsm', -5, 'less'),
+        threshold_periods(frame, 'plasma_speed', 500, 'greater'),
+        threshold_periods(frame, 'proton_density', 10, 'greater'),
+        threshold_periods(frame, 'dst_index', -50, 'less'),
+    ]
+
+
+def line_figure(dataset, rows):
+    x, y = decimate(dataset['datetime'][rows], dataset['bz_gsm'][rows])
+    fig = go.Figure(go.Scattergl(x=x, y=y, mode='lines'))
+    fig.add_hline(y=-5, line=dict(color='red', dash='dash'))
+    return fig
+
+
+def pair_stats(dataset):
+    stats = PairStats(dataset['datetime'])
+    for col in PARAMETERS:
+        stats.add_column(col, dataset[col])
+    return stats
+
+
+def rolling_incremental(dataset, hours=366 * 24):
+    """Extend every rolling window over the first ``hours`` in a mix of live
+    steps and batches, as the Live page does."""
+    start, grid = hourly(dataset, 'bz_gsm')
+    grid = grid[:hours]
+    sizes = itertools.cycle((1, 1, 2, 5, 70, 200))
+    for window in WINDOWS.values():
+        rolling = RollingWindow(window)
+        rolling.extend(grid[:100], start)
+        done = 100
+        while done < len(grid):
+            size = next(sizes)
+            rolling.extend(grid[done:done + size])
+            done += size
+
+
+def generate_yearly(directory, years, seed=0, start_year=1963):
+    """One omni2_YYYY.dat file per year, as upstream OMNI distributes them."""
+    os.makedirs(directory, exist_ok=True)
+    for i in range(years):
+        synth.generate(os.path.join(directory, f'omni2_{start_year + i}.dat'), 1, start_year + i, seed=seed + i)
+
+
+def touch_last(directory):
+    # A daily update only rewrites the current year's file
+    path = sorted(os.listdir(directory))[-1]
+    with open(os.path.join(directory, path), 'a'):
+        pass
+    os.utime(os.path.join(directory, path))
+
+
+def run(path, legacy=False, yearly=None):
+    recorder = Recorder()
+    if legacy:
+        recorder.stage('legacy_parse', legacy_parse, path)
+    if yearly:
+        recorder.stage('yearly_parse_pool', load_dataset, yearly,
+                       setup=lambda: shutil.rmtree(os.path.join(yearly, CACHE_DIR), ignore_errors=True))
+        recorder.stage('yearly_update_one', load_dataset, yearly, setup=lambda: touch_last(yearly))
+    recorder.stage('parse_to_cache', build_cache, path)
+    dataset = recorder.stage('load_cached', load_dataset, path)
+    n = len(dataset)
+    numeric = dataset.numeric_columns()
+    rollup = recorder.stage('rollup_build', lambda: Rollup(dataset['datetime'], {c: dataset[c] for c in numeric}), rows=n)
+    recorder.stage('groupby_monthly_legacy', legacy_monthly_groupby, dataset, rows=n)
+    fig = recorder.stage('heatmap_figure', rollup_heatmap, rollup)
+    recorder.payload('heatmap_figure', fig)
+    recorder.stage('pair_stats_build', pair_stats, dataset, rows=n)
+    frame = dataset.frame()
+    recorder.stage('event_detection', detect_events, frame, rows=n)
+    end = dataset['datetime'][-1]
+    week = dataset.index.slice(end - np.timedelta64(7, 'D'), end)
+    fig = recorder.stage('figure_week', line_figure, dataset, week, rows=week.stop - week.start)
+    recorder.payload('figure_week', fig)
+    fig = recorder.stage('figure_full_history', line_figure, dataset, slice(None), rows=n)
+    recorder.payload('figure_full_history', fig)
+    recorder.stage('forecast_train', forecast.train, dataset, rows=n)
+    recorder.stage('rolling_incremental', rolling_incremental, dataset)
+    return n, recorder.stages
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(HISTORY)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _previous(history, params):
+    for entry in reversed(history):
+        if entry['params'] == params:
+            return entry
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--years', type=int, default=60, help='years of hourly data at scale 1')
+    parser.add_argument('--scale', type=float, default=1, help='multiplier on --years')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--legacy', action='store_true', help='also time the original pandas text parse')
+    parser.add_argument('--yearly', action='store_true', help='also time parsing one file per year in parallel')
+    parser.add_argument('--data-dir', help='keep the generated file here instead of a temp dir')
+    parser.add_argument('--history', default=HISTORY)
+    args = parser.parse_args(argv)
+
+    years = max(1, int(round(args.years * args.scale)))
+    params = {'years': years, 'seed': args.seed, 'legacy': args.legacy, 'yearly': args.yearly, 'columns': len(SCHEMA)}
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or tmp
+        os.makedirs(data_dir, exist_ok=True)
+        path = os.path.join(data_dir, f'synth_{years}y_{args.seed}.dat')
+        start = time.perf_counter()
+        synth.generate(path, years, seed=args.seed)
+        print(f'generated {years} years ({os.path.getsize(path) / 2 ** 20:.0f} MB) in {time.perf_counter() - start:.1f} s')
+        yearly = None
+        if args.yearly:
+            yearly = os.path.join(data_dir, f'yearly_{years}y_{args.seed}')
+            generate_yearly(yearly, years, args.seed)
+        rows, stages = run(path, args.legacy, yearly)
+
+    try:
+        with open(args.history) as f:
+            history = json.load(f)
+    except (OSError, ValueError):
+        history = []
+    previous = _previous(history, params)
+    if previous:
+        print(f"\ncompared with {previous['commit']} ({previous['timestamp']}):")
+        for name, stage in stages.items():
+            if name in previous['stages']:
+                before = previous['stages'][name]['seconds']
+                print(f'{name:<22} {stage["seconds"] / before if before else float("nan"):8.2f}x')
+
+    history.append({
+        'commit': _commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'params': params,
+        'rows': rows,
+        'stages': stages,
+    })
+    with open(args.history, 'w') as f:
+        json.dump(history, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
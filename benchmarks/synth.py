@@ -0,0 +1,164 @@
+"""Synthetic OMNI hourly files for benchmarking.
+
+Writes fixed-width files in the OMNI format described by ``SCHEMA`` in
+utils/loader.py: smooth noise around typical values, runs of fill
+sentinels, and storm-like excursions (southward Bz, fast dense wind, Dst
+dips with an exponential recovery).
+
+    python -m benchmarks.synth out.dat --years 120
+"""
+import argparse
+
+import numpy as np
+
+from utils.loader import SCHEMA
+
+HOURS_PER_YEAR = 8766
+
+# Typical (mean, std, fraction missing) of the columns that matter; the rest
+# get small values well inside their format width.
+PROFILES = {
+    'field_magnitude_avg': (6, 3, 0.1),
+    'magnitude_avg_field_vector': (5, 3, 0.1),
+    'bx_gse': (0, 4, 0.1),
+    'by_gse': (0, 4, 0.1),
+    'bz_gse': (0, 3, 0.1),
+    'by_gsm': (0, 4, 0.1),
+    'bz_gsm': (0, 3, 0.1),
+    'proton_temperature': (100000, 60000, 0.15),
+    'proton_density': (6, 4, 0.15),
+    'plasma_speed': (420, 90, 0.15),
+    'flow_pressure': (2, 1.5, 0.15),
+    'electric_field': (0, 1.5, 0.15),
+    'plasma_beta': (2, 1.5, 0.15),
+    'alfven_mach_number': (10, 4, 0.15),
+    'kp': (20, 12, 0.01),
+    'r': (80, 60, 0.01),
+    'dst_index': (-12, 15, 0.01),
+    'ae_index': (200, 180, 0.1),
+    'ap_index': (12, 10, 0.01),
+    'f10.7_index': (120, 40, 0.02),
+    'pc_n_index': (0.8, 1.0, 0.3),
+    'al_index': (-150, 150, 0.1),
+    'au_index': (100, 80, 0.1),
+    'proton_flux_1': (1, 2, 0.6),
+    'proton_flux_2': (0.5, 1, 0.6),
+    'proton_flux_4': (0.3, 0.5, 0.6),
+    'proton_flux_10': (0.2, 0.3, 0.6),
+    'proton_flux_30': (0.1, 0.2, 0.6),
+    'proton_flux_60': (0.1, 0.1, 0.6),
+    'flag': (0, 1, 0),
+}
+
+# Peak change during a storm and its e-folding recovery time in hours
+STORM = {
+    'bz_gsm': (-15, 6),
+    'bz_gse': (-14, 6),
+    'field_magnitude_avg': (15, 8),
+    'plasma_speed': (250, 24),
+    'proton_density': (15, 6),
+    'flow_pressure': (8, 6),
+    'electric_field': (6, 6),
+    'dst_index': (-150, 15),
+    'kp': (50, 12),
+    'ap_index': (80, 12),
+    'ae_index': (800, 6),
+    'al_index': (-800, 6),
+    'au_index': (300, 6),
+}
+STORM_HOURS = 96
+
+# Columns that can go negative; everything else is clipped at zero
+SIGNED = {
+    'lat_angle_avg_field_vector', 'bx_gse', 'by_gse', 'bz_gse', 'by_gsm', 'bz_gsm',
+    'plasma_flow_long_angle', 'plasma_flow_lat_angle', 'electric_field', 'dst_index', 'al_index', 'flag',
+}
+
+
+def fortran_format(fmt):
+    """printf format and (low, high) value range for a Fortran ``Iw`` / ``Fw.d``."""
+    kind = fmt[0]
+    width, _, decimals = fmt[1:].partition('.')
+    width, decimals = int(width), int(decimals or 0)
+    # One leading blank keeps whitespace-separated fields apart
+    digits = width - 1 - (decimals + 1 if kind == 'F' else 0)
+    limits = (-(10 ** (digits - 1) - 1), 10 ** digits - 1)
+    if kind == 'I':
+        return f'%{width}d', limits
+    if decimals == 0:
+        return f'%{width - 1}.0f.', limits
+    return f'%{width}.{decimals}f', limits
+
+
+def _smooth_noise(rng, n, hours=12):
+    noise = rng.standard_normal(n + hours)
+    return np.convolve(noise, np.ones(hours) / np.sqrt(hours), mode='valid')[:n]
+
+
+def _storm_kernel(tau):
+    t = np.arange(STORM_HOURS)
+    return np.where(t < 3, t / 3, np.exp(-(t - 3) / tau))
+
+
+def generate_chunk(rng, start, hours, storms_per_year=10):
+    """``(hours, 55)`` array of OMNI values for ``hours`` rows from ``start``."""
+    times = start + np.arange(hours)
+    days = times.astype('datetime64[D]')
+    years = times.astype('datetime64[Y]')
+    out = np.empty((hours, len(SCHEMA)))
+    out[:, 0] = years.astype('int64') + 1970
+    out[:, 1] = (days - years.astype('datetime64[D]')).astype('int64') + 1
+    out[:, 2] = (times - days.astype('datetime64[h]')).astype('int64')
+
+    impulses = np.zeros(hours)
+    n_storms = rng.poisson(storms_per_year * hours / HOURS_PER_YEAR)
+    impulses[rng.integers(0, hours, n_storms)] = rng.lognormal(0, 0.4, n_storms)
+
+    for i, (name, fmt, fill, _) in enumerate(SCHEMA[3:], start=3):
+        _, (low, high) = fortran_format(fmt)
+        if fill is not None:
+            high = min(high, 0.9 * fill)
+        if name not in SIGNED:
+            low = 0
+        mean, std, missing = PROFILES.get(name, (0.05 * high, 0.01 * high, 0.05))
+        values = mean + std * _smooth_noise(rng, hours)
+        if name in STORM:
+            peak, tau = STORM[name]
+            values += peak * np.convolve(impulses, _storm_kernel(tau))[:hours]
+        if name == 'bartels_rotation':
+            values = 1 + (times - np.datetime64('1832-02-08T00', 'h')).astype('int64') // (27 * 24)
+        if fmt[0] == 'I':
+            values = np.round(values)
+        values = np.clip(values, low, high)
+        if fill is not None and missing:
+            # Missing data comes in runs of roughly a day
+            gaps = np.repeat(rng.random(-(-hours // 24)) < missing, 24)[:hours]
+            values[gaps] = fill
+        out[:, i] = values
+    return out
+
+
+def generate(path, years=60, start_year=1963, storms_per_year=10, seed=0, chunk_hours=HOURS_PER_YEAR):
+    """Write ``years`` of synthetic hourly OMNI rows to ``path``; returns the row count."""
+    rng = np.random.default_rng(seed)
+    start = np.datetime64(f'{start_year:04d}-01-01T00', 'h')
+    end = np.datetime64(f'{start_year + years:04d}-01-01T00', 'h')
+    line_format = ''.join(fortran_format(fmt)[0] for _, fmt, _, _ in SCHEMA)
+    rows = 0
+    with open(path, 'w') as f:
+        while start < end:
+            hours = int(min(chunk_hours, (end - start) // np.timedelta64(1, 'h')))
+            np.savetxt(f, generate_chunk(rng, start, hours, storms_per_year), fmt=line_format)
+            start += np.timedelta64(hours, 'h')
+            rows += hours
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path')
+    parser.add_argument('--years', type=int, default=60)
+    parser.add_argument('--start-year', type=int, default=1963)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print(generate(args.path, args.years, args.start_year, seed=args.seed), 'rows written to', args.path)
@@ -4,25 +4,37 @@ import streamlit as st
 import seaborn as sns
 import matplotlib.pyplot as plt
 import plotly.express as px
+import plotly.graph_objects as go
 from datetime import datetime
 from utils.loader import *
+from utils.rollup import Rollup
+from utils.downsample import MAX_POINTS, decimate
+from utils.render import cached_figure
+from utils.correlation import PairStats
+from utils.storms import THRESHOLD, catalog_frame, superposed_epoch
+from utils.profiling import end_run, plotly_chart, stage, start_run
 
 st.set_page_config(layout="wide")
+start_run('Analysis')
 
-# Load data
-with st.spinner('Loading data...'):
-    df = load_old_data()
 
-# Preprocess data
-df['datetime'] = pd.to_datetime(df['datetime'])
-df['year'] = df['datetime'].dt.year
-df['month'] = df['datetime'].dt.month
-df['day'] = df['datetime'].dt.day
+@st.cache_resource
+def load_rollup():
+    # Daily / monthly / yearly aggregates for the heatmaps, built once per process
+    dataset = load_old_dataset()
+    return Rollup(dataset['datetime'], {col: dataset[col] for col in dataset.numeric_columns()})
+
 
-# Remove the fill values for proper handling
-fill_values = [9999.9, 99999.9, 9999999, 999.9, 99999, 9999, 99.99, 999.99, 999]
-df.replace(fill_values, 0, inplace=True)
-df.dropna(inplace=True)
+@st.cache_resource
+def load_pair_stats():
+    # Columns are added on demand, so a new parameter costs one pass over it
+    return PairStats(load_old_dataset()['datetime'])
+
+
+# Load data
+with st.spinner('Loading data...'), stage('load'):
+    dataset = load_old_dataset()
+    rollup = load_rollup()
 
 st.title('📊 Historical Analysis of Solar Wind Parameters and Geomagnetic Indices')
 
@@ -46,16 +58,38 @@ parameter_name = st.sidebar.selectbox('Select a parameter to analyze', list(para
 parameter_col = parameters[parameter_name]
 
 # Year selection for heatmap
-years = df['year'].unique().tolist()
+years = rollup.years()
 years.insert(0, 'All')  # Add 'All' option at the beginning
 selected_year = st.sidebar.selectbox('Select Year for Heatmap', years)
 
-# Show heatmap according to selected year
-if selected_year == 'All':
+# Heatmaps are cached per data version, parameter and year, so they are
+# built once and shared by every session
+def monthly_heatmap():
     # Aggregate data to monthly averages
-    monthly_df = df.groupby(['year', 'month'])[parameter_col].mean().reset_index()
-    monthly_pivot = monthly_df.pivot(index='year', columns='month', values=parameter_col)
+    with stage('rollup:month'):
+        monthly_df = rollup.frame('month', parameter_col)
+        monthly_pivot = monthly_df.pivot(index='year', columns='month', values=parameter_col)
+    fig = px.imshow(monthly_pivot, labels={'x': 'Month', 'y': 'Year', 'color': f'Monthly Average {parameter_name}'},
+                    x=monthly_pivot.columns, y=monthly_pivot.index,
+                    color_continuous_scale='Viridis', aspect='auto')
+    fig.update_layout(title=f'Monthly Average {parameter_name} (1963 - Present)', height=700)
+    return fig
+
+
+def daily_heatmap():
+    # Filter data for the selected year and compute daily averages
+    with stage('rollup:day'):
+        daily_df = rollup.frame('day', parameter_col, start=f'{selected_year}-01-01', end=f'{selected_year + 1}-01-01')
+        daily_pivot = daily_df.pivot(index='day', columns='month', values=parameter_col)
+    fig = px.imshow(daily_pivot, labels={'x': 'Month', 'y': 'Day', 'color': f'Daily Average {parameter_name}'},
+                    x=daily_pivot.columns, y=daily_pivot.index,
+                    color_continuous_scale='Viridis', aspect='auto')
+    fig.update_layout(title=f'Daily Average {parameter_name} ({selected_year})')
+    return fig
+
 
+# Show heatmap according to selected year
+if selected_year == 'All':
     # Plot heatmap for all years using Plotly
     st.subheader(f'Heatmap of Monthly Average {parameter_name}')
 
@@ -63,18 +97,10 @@ if selected_year == 'All':
     The heatmap below shows the monthly average values of **{parameter_name}** from 1964 to the present. Each cell represents the average value for a given month and year.
     """)
 
-    fig = px.imshow(monthly_pivot, labels={'x': 'Month', 'y': 'Year', 'color': f'Monthly Average {parameter_name}'},
-                    x=monthly_pivot.columns, y=monthly_pivot.index,
-                    color_continuous_scale='Viridis', aspect='auto')
-    fig.update_layout(title=f'Monthly Average {parameter_name} (1963 - Present)', height=700)
-    st.plotly_chart(fig, use_container_width=True)
+    fig = cached_figure((dataset.version, 'heatmap', parameter_col, 'All', 'month'), monthly_heatmap)
+    plotly_chart(fig, 'heatmap', use_container_width=True)
 
 else:
-    # Filter data for the selected year and compute daily averages
-    yearly_df = df[df['year'] == selected_year]
-    daily_df = yearly_df.groupby(['month', 'day'])[parameter_col].mean().reset_index()
-    daily_pivot = daily_df.pivot(index='day', columns='month', values=parameter_col)
-
     # Plot heatmap for the selected year with daily averages using Plotly
     st.subheader(f'Heatmap of Daily Average {parameter_name} in {selected_year}')
 
@@ -82,17 +108,26 @@ else:
     The heatmap below shows the daily average values of **{parameter_name}** for each month in **{selected_year}**. This detailed view allows you to see intra-month variability.
     """)
 
-    fig = px.imshow(daily_pivot, labels={'x': 'Month', 'y': 'Day', 'color': f'Daily Average {parameter_name}'},
-                    x=daily_pivot.columns, y=daily_pivot.index,
-                    color_continuous_scale='Viridis', aspect='auto')
-    fig.update_layout(title=f'Daily Average {parameter_name} ({selected_year})')
-    st.plotly_chart(fig, use_container_width=True)
+    fig = cached_figure((dataset.version, 'heatmap', parameter_col, selected_year, 'day'), daily_heatmap)
+    plotly_chart(fig, 'heatmap', use_container_width=True)
 
 # Explanatory text
 st.write(f"""
 The heatmap above provides a visual representation of how **{parameter_name}** has varied over the decades. Darker colors indicate lower values, while brighter colors represent higher values. Trends, seasonal variations, and anomalies can be identified through this visualization.
 """)
 
+# Storm catalog, built once from the Dst minima and cached beside the data
+st.subheader('Geomagnetic Storm Catalog')
+
+with stage('storms:catalog'):
+    storm_catalog = load_storm_catalog()
+    storm_df = catalog_frame(storm_catalog).sort_values('dst_min', kind='stable')
+
+st.write(f"""
+The catalog lists the **{len(storm_df)}** geomagnetic storms in the record, found where the Dst index fell to **{THRESHOLD} nT** or below. The main phase runs from the onset to the Dst minimum and the recovery phase until Dst has recovered to a quarter of its minimum.
+""")
+st.dataframe(storm_df, use_container_width=True, hide_index=True)
+
 # Additional Analysis: Time Series Plot of Notable Events
 st.subheader(f'Time Series of {parameter_name} During Notable Events')
 
@@ -100,24 +135,71 @@ st.write(f"""
 Below you can select a date range to examine the behavior of **{parameter_name}** during specific periods, such as known geomagnetic storms or solar events.
 """)
 
+# Pick a catalogued storm (strongest first) or any date range
+storm_labels = ['Custom range'] + [f'{storm.dst_minimum_time:%Y-%m-%d} ({storm.intensity}, Dst {storm.dst_min:.0f} nT)' for storm in storm_df.itertuples()]
+storm_choice = st.selectbox('Storm', range(len(storm_labels)), format_func=storm_labels.__getitem__)
+if storm_choice:
+    storm = storm_df.iloc[storm_choice - 1]
+    default_start = (storm['onset'] - pd.Timedelta(days=1)).date()
+    default_end = (storm['recovery_end'] + pd.Timedelta(days=1)).date()
+else:
+    default_start, default_end = datetime(2000, 1, 1), datetime(2000, 1, 31)
+
 # User inputs for date range
-start_date = st.date_input('Start Date', datetime(2000, 1, 1))
-end_date = st.date_input('End Date', datetime(2000, 1, 31))
+start_date = st.date_input('Start Date', default_start)
+end_date = st.date_input('End Date', default_end)
 
 if start_date > end_date:
     st.error('Error: End date must fall after start date.')
 else:
-    mask = (df['datetime'] >= pd.to_datetime(start_date)) & (df['datetime'] <= pd.to_datetime(end_date))
-    df_event = df.loc[mask]
+    rows = dataset.index.slice(start_date, end_date)
 
     # Plot the parameter over the selected date range
-    fig = px.line(df_event, x='datetime', y=parameter_col, title=f'{parameter_name} from {start_date} to {end_date}')
-    st.plotly_chart(fig, use_container_width=True)
+    def event_figure():
+        with stage('event:decimate', rows=rows.stop - rows.start):
+            x, y = decimate(dataset['datetime'][rows], dataset[parameter_col][rows])
+        df_plot = pd.DataFrame({'datetime': x, parameter_col: y})
+        return px.line(df_plot, x='datetime', y=parameter_col, render_mode='webgl', title=f'{parameter_name} from {start_date} to {end_date}')
+
+    fig = cached_figure((dataset.version, 'event', parameter_col, (start_date, end_date), MAX_POINTS), event_figure)
+    plotly_chart(fig, 'event', use_container_width=True)
 
     st.write(f"""
     The plot above shows the variation of **{parameter_name}** during the selected period. You can use this tool to explore specific events and observe how the parameter of interest behaved.
     """)
 
+# Superposed epoch analysis around the catalogued storm onsets
+st.subheader(f'Superposed Epoch Analysis of {parameter_name}')
+
+st.write(f"""
+Every catalogued storm is aligned on its onset and **{parameter_name}** is stacked across them. The line shows the median at each hour from the onset and the band the 25th to 75th percentiles, revealing the typical storm-time behavior of the parameter.
+""")
+
+epoch_days = st.slider('Days either side of the onset', 1, 10, 3)
+epoch_intensity = st.selectbox('Storms', ['All', 'moderate', 'intense', 'severe'])
+onsets = storm_df['onset'].to_numpy() if epoch_intensity == 'All' else storm_df.loc[storm_df['intensity'] == epoch_intensity, 'onset'].to_numpy()
+
+
+def epoch_figure():
+    with stage('storms:epoch', rows=len(onsets)):
+        epoch = superposed_epoch(dataset, parameter_col, onsets, days=epoch_days)
+    lag_days = epoch['lag_hours'] / 24
+    low, high = epoch['quantiles'].values()
+    fig_epoch = go.Figure()
+    fig_epoch.add_trace(go.Scatter(x=np.concatenate((lag_days, lag_days[::-1])), y=np.concatenate((high, low[::-1])),
+                                   fill='toself', line=dict(width=0), fillcolor='rgba(99, 110, 250, 0.3)', name='25th-75th percentile'))
+    fig_epoch.add_trace(go.Scatter(x=lag_days, y=epoch['median'], mode='lines', name='Median', line=dict(color='blue')))
+    fig_epoch.add_vline(x=0, line=dict(color='red', dash='dash'), annotation_text='Onset')
+    fig_epoch.update_layout(title=f"{parameter_name} around {epoch['events']} storm onsets", xaxis_title='Days from onset', yaxis_title=parameter_name)
+    return fig_epoch
+
+
+if len(onsets):
+    fig_epoch = cached_figure((dataset.version, 'epoch', parameter_col, epoch_days, epoch_intensity), epoch_figure)
+    plotly_chart(fig_epoch, 'epoch', use_container_width=True)
+else:
+    st.write('No storms of this intensity in the record.')
+
 # Correlation Analysis
 st.subheader('Correlation Analysis Between Parameters')
 
@@ -133,25 +215,38 @@ param2_name = st.selectbox('Select second parameter', param_options, index=1)
 param1_col = parameters[param1_name]
 param2_col = parameters[param2_name]
 
-# Scatter plot with regression line
-st.write(f'**Scatter Plot of {param1_name} vs {param2_name}**')
+with stage('pair_stats'):
+    pair_stats = load_pair_stats()
+    for col in parameters.values():
+        pair_stats.add_column(col, dataset[col])
+
+# Density plot with regression line
+st.write(f'**Density Plot of {param1_name} vs {param2_name}**')
+
+fit = pair_stats.regression(param1_col, param2_col)
+
 
-# Remove NaN values for both parameters
-df_corr = df[[param1_col, param2_col]].dropna()
+def correlation_figure():
+    counts, x_edges, y_edges = pair_stats.histogram(param1_col, param2_col)
+    fig_corr = go.Figure()
+    fig_corr.add_trace(go.Heatmap(x=(x_edges[:-1] + x_edges[1:]) / 2, y=(y_edges[:-1] + y_edges[1:]) / 2,
+                                  z=np.log10(counts.T + 1), colorscale='Viridis', colorbar=dict(title='log10(count)')))
+    fig_corr.add_trace(go.Scatter(x=x_edges[[0, -1]], y=fit['intercept'] + fit['slope'] * x_edges[[0, -1]],
+                                  mode='lines', name='OLS trendline', line=dict(color='red')))
+    fig_corr.update_layout(title=f'{param1_name} vs {param2_name}', xaxis_title=param1_name, yaxis_title=param2_name)
+    return fig_corr
 
-fig_corr = px.scatter(df_corr, x=param1_col, y=param2_col, trendline='ols',
-                      labels={param1_col: param1_name, param2_col: param2_name},
-                      title=f'{param1_name} vs {param2_name}')
 
-st.plotly_chart(fig_corr, use_container_width=True)
+fig_corr = cached_figure((dataset.version, 'correlation', param1_col, param2_col), correlation_figure)
+plotly_chart(fig_corr, 'correlation', use_container_width=True)
 
 # Show correlation coefficient
-corr_coef = df_corr[param1_col].corr(df_corr[param2_col])
+corr_coef = fit['r']
 st.write(f'The correlation coefficient between **{param1_name}** and **{param2_name}** is **{corr_coef:.2f}**.')
 
 # Explanatory text
 st.write("""
-The scatter plot and correlation coefficient indicate the strength and direction of the linear relationship between the selected parameters. A value close to 1 or -1 signifies a strong linear relationship, while a value near 0 indicates a weak or no linear relationship.
+The density plot and correlation coefficient indicate the strength and direction of the linear relationship between the selected parameters. A value close to 1 or -1 signifies a strong linear relationship, while a value near 0 indicates a weak or no linear relationship.
 """)
 
 # Conclusion
@@ -161,3 +256,4 @@ st.write("""
 By analyzing the historical data of solar wind parameters and geomagnetic indices, we can observe long-term trends, seasonal patterns, and correlations between different variables. This information is valuable for understanding space weather phenomena and their potential impacts on Earth's environment and technological systems.
 """)
 
+end_run()
@@ -1,28 +1,43 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
-from datetime import datetime, timedelta
+from datetime import timedelta
 import plotly.express as px
+from utils.events import find_periods, threshold_mask
+from utils.loader import load_forecast_model, load_latest_dataset
+from utils import forecast
+from utils.profiling import end_run, plotly_chart, stage, start_run
 
 st.set_page_config(layout="wide")
+start_run('Predictions')
 
 st.title('🔮 Solar Wind Parameters and Geomagnetic Indices Predictions')
 
 st.write("""
-This page provides predicted values for key solar wind parameters and geomagnetic indices over the next five days. These predictions are currently static and based on general estimates but can be replaced with model-based predictions in the future.
+This page provides predicted values for key solar wind parameters and geomagnetic indices over the next five days. The predictions come from a ridge regression model trained on the historical OMNI data, which uses the last day of hourly observations of each parameter.
 """)
 
-# Predicting for the next 5 days
-future_dates = [datetime.now() + timedelta(days=i) for i in range(1, 6)]
+with st.spinner('Loading forecast model...'), stage('load'):
+    model = load_forecast_model()
+    dataset = load_latest_dataset()
+
+# Predicting for the next 5 days, counted from the last observed hour
+with stage('predict'):
+    window, last_observed = forecast.recent_window(dataset, model['lags'])
+    forecasts = forecast.predict(model, window)
+future_dates = [pd.Timestamp(last_observed) + timedelta(hours=int(h)) for h in model['horizons']]
 future_dates_str = [date.strftime('%Y-%m-%d') for date in future_dates]
 
-# General static predictions (replace with model-based values in the future)
+# Model columns shown on this page (OMNI stores Kp multiplied by 10)
+forecast_columns = {
+    'IMF Bz (GSM)': ('bz_gsm', 1),
+    'Solar Wind Speed (km/s)': ('plasma_speed', 1),
+    'Proton Density (N/cm³)': ('proton_density', 1),
+    'Dst Index (nT)': ('dst_index', 1),
+    'Kp Index': ('kp', 10),
+}
 predictions = {
-    'IMF Bz (GSM)': np.random.uniform(-10, 10, 5),  # Example random predictions around a typical Bz range
-    'Solar Wind Speed (km/s)': np.random.uniform(300, 700, 5),  # Typical solar wind speeds
-    'Proton Density (N/cm³)': np.random.uniform(1, 15, 5),  # General proton density range
-    'Dst Index (nT)': np.random.uniform(-100, 20, 5),  # Typical Dst index during non-extreme conditions
-    'Kp Index': np.random.uniform(0, 9, 5),  # Typical full Kp range
+    name: forecasts[:, forecast.COLUMNS.index(col)] / scale
+    for name, (col, scale) in forecast_columns.items()
 }
 
 # Static threshold values for alerts
@@ -38,33 +53,33 @@ thresholds = {
 prediction_df = pd.DataFrame(predictions, index=future_dates_str)
 
 # Display predictions
-st.write("### Predicted Values for the Next 5 Days")
+st.write(f"### Predicted Values for the Next 5 Days (from {pd.Timestamp(last_observed).strftime('%Y-%m-%d %H:%M')})")
 st.table(prediction_df)
 
 st.write("""
-These predictions give a general indication of expected solar and geomagnetic conditions over the next few days. Predictions will be refined using advanced models and real-time data inputs to provide more accurate forecasts.
+These predictions give a general indication of expected solar and geomagnetic conditions over the next few days. The model is retrained automatically when the historical data changes, and can be rebuilt ahead of time with `python -m utils.forecast`.
 """)
 
 # Alert messages
 st.subheader('Alerts')
 alert_messages = []
 
+# Parameters that alert when they fall below their threshold; the rest alert above it
+below_threshold = ['IMF Bz (GSM)', 'Dst Index (nT)']
+
 for parameter in prediction_df.columns:
-    values = prediction_df[parameter]
     threshold = thresholds[parameter]
+    condition = 'less' if parameter in below_threshold else 'greater'
+    periods = find_periods(threshold_mask(prediction_df[parameter].to_numpy(), threshold, condition))
+    if not len(periods):
+        continue
+    days = ', '.join(future_dates_str[start] if start == end else f"{future_dates_str[start]} to {future_dates_str[end]}" for start, end in periods)
     if parameter == 'IMF Bz (GSM)':
-        # Check if values fall below the threshold for IMF Bz (GSM)
-        if min(values) < threshold:
-            alert_messages.append(f"**Alert for {parameter}:** Predicted values may fall below the threshold of {threshold} nT.")
-    elif parameter in ['Dst Index (nT)']:
-        # Check if values fall below the threshold for Dst
-        if min(values) < threshold:
-            alert_messages.append(f"**Alert for {parameter}:** Predicted values may indicate geomagnetic storm conditions (< {threshold} nT).")
+        alert_messages.append(f"**Alert for {parameter}:** Predicted values may fall below the threshold of {threshold} nT ({days}).")
+    elif parameter == 'Dst Index (nT)':
+        alert_messages.append(f"**Alert for {parameter}:** Predicted values may indicate geomagnetic storm conditions (< {threshold} nT) ({days}).")
     else:
-        # For other parameters, check if values exceed the threshold
-        if max(values) > threshold:
-            alert_messages.append(f"**Alert for {parameter}:** Predicted values may exceed the threshold of {threshold}.")
-
+        alert_messages.append(f"**Alert for {parameter}:** Predicted values may exceed the threshold of {threshold} ({days}).")
 
 # Plot predicted values with threshold lines
 st.write("### Visual Representation of Predictions")
@@ -76,7 +91,7 @@ for parameter in prediction_df.columns:
         # Add threshold line
         threshold_line = thresholds[parameter]
         fig.add_hline(y=threshold_line, line_dash="dot", annotation_text=f"Threshold: {threshold_line}", annotation_position="bottom right")
-    st.plotly_chart(fig, use_container_width=True)
+    plotly_chart(fig, parameter, use_container_width=True)
 
 st.write("""
 The above plots visually represent our predictions, showing potential trends and variations over the next five days. These can be instrumental in planning and preparing for space weather impacts.
@@ -89,3 +104,5 @@ if alert_messages:
     st.error(ms)
 else:
     st.success('✅ No alerts. Predicted values are within normal ranges.')
+
+end_run()
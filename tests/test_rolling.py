@@ -0,0 +1,121 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.dataset import Dataset
+from utils.rolling import STATS, WINDOWS, RollingCache, RollingWindow, hourly
+
+START = np.datetime64('2024-01-01T00', 'h')
+
+
+def series(n=3000, seed=0):
+    """Hourly values with scattered NaNs and, if long enough, a few long NaN runs."""
+    rng = np.random.default_rng(seed)
+    values = rng.normal(-1, 4, n)
+    values[rng.random(n) < 0.05] = np.nan
+    if n > 200:
+        for first in rng.integers(0, n - 100, 5):
+            values[first:first + rng.integers(10, 100)] = np.nan
+    return values
+
+
+def expected(values, window, min_valid=1):
+    rolling = pd.Series(values).rolling(window, min_periods=min_valid)
+    return {
+        'count': pd.Series(values).notna().astype(float).rolling(window, min_periods=1).sum().to_numpy(),
+        'mean': rolling.mean().to_numpy(),
+        'std': rolling.std(ddof=0).to_numpy(),
+        'min': rolling.min().to_numpy(),
+        'max': rolling.max().to_numpy(),
+    }
+
+
+def check(rolling, reference):
+    for stat in STATS:
+        np.testing.assert_allclose(rolling.values(stat), reference[stat], rtol=1e-6, atol=1e-6, err_msg=stat)
+
+
+@pytest.mark.parametrize('window', WINDOWS.values())
+@pytest.mark.parametrize('min_valid', [1, 3])
+def test_bulk_extend_matches_pandas(window, min_valid):
+    values = series()
+    rolling = RollingWindow(window, min_valid)
+    rolling.extend(values, START)
+    check(rolling, expected(values, window, min_valid))
+
+
+@pytest.mark.parametrize('window', WINDOWS.values())
+def test_stepped_extends_match_bulk_extend(window):
+    values = series()
+    bulk = RollingWindow(window)
+    bulk.extend(values, START)
+    pieces = RollingWindow(window)
+    pieces.extend(values[:100], START)
+    done = 100
+    for size in itertools.cycle((1, 1, 2, 5, 70, 200)):
+        if done >= len(values):
+            break
+        pieces.extend(values[done:done + size])
+        done += size
+    check(pieces, {stat: bulk.values(stat) for stat in STATS})
+    check(pieces, expected(values, window))
+
+
+def test_batch_extend_after_short_history():
+    # Fewer than window - 1 hours seen, then a batch: all of them count
+    window = WINDOWS['27 days (Bartels rotation)']
+    values = series(1000)
+    rolling = RollingWindow(window)
+    rolling.extend(values[:400], START)
+    rolling.extend(values[400:])
+    check(rolling, expected(values, window))
+
+
+def test_first_extend_needs_start():
+    with pytest.raises(ValueError):
+        RollingWindow(24).extend(series(10))
+
+
+def test_slice_and_times():
+    rolling = RollingWindow(3)
+    rolling.extend(series(48), START)
+    hours = rolling.slice('2024-01-01T05:30', '2024-01-01T10:00')
+    assert (hours.start, hours.stop) == (6, 11)
+    assert rolling.times(hours)[0] == np.datetime64('2024-01-01T06:00', 'ns')
+
+
+def dataset(values, version, rows=None):
+    times = (START + np.arange(len(values))).astype('datetime64[ns]')
+    rows = slice(None) if rows is None else rows
+    return Dataset({'datetime': times[rows], 'bz_gsm': values[rows].astype('float32')}, version=version)
+
+
+def test_hourly_fills_missing_hours():
+    values = series(50)
+    data = dataset(values, None)
+    keep = np.r_[0:10, 20:50]
+    start, grid = hourly(Dataset({name: data[name][keep] for name in data.columns}), 'bz_gsm')
+    assert start == START and len(grid) == 50
+    assert np.isnan(grid[10:20]).all()
+    np.testing.assert_array_equal(grid[keep], data['bz_gsm'][keep])
+
+
+def test_cache_extends_appended_rows():
+    values = series(500)
+    cache = RollingCache()
+    first = cache.get(dataset(values, ('latest.dat', 1, 1), slice(0, 400)), 'bz_gsm', 24)
+    second = cache.get(dataset(values, ('latest.dat', 1, 2)), 'bz_gsm', 24)
+    assert second is first
+    check(second, expected(values.astype('float32').astype('float64'), 24))
+
+
+def test_cache_rebuilds_after_reload():
+    values = series(500)
+    cache = RollingCache()
+    cache.get(dataset(values, ('latest.dat', 1, 1), slice(0, 400)), 'bz_gsm', 24)
+    revised = values.copy()
+    revised[380:] = -20
+    rolling = cache.get(dataset(revised, ('latest.dat', 2, 2)), 'bz_gsm', 24)
+    check(rolling, expected(revised.astype('float32').astype('float64'), 24))
@@ -0,0 +1,325 @@
+"""Headless threshold alerts for latest.dat.
+
+The daemon watches the file through a TailLoader and evaluates the alert
+rules only on the rows appended since the previous tick, carrying which
+alerts are open from one tick to the next. Alert start and end events are
+appended to a JSONL log and, optionally, POSTed to a webhook; the current
+state goes to a JSON file that Live.py reads instead of recomputing it.
+
+    python -m utils.alerts --interval 60 --webhook http://localhost:8080/alerts
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from utils.events import find_periods, threshold_mask
+
+# name -> (column, condition, threshold[, exit_threshold]), as in events.detect
+DEFAULT_RULES = {
+    'bz': ('bz_gsm', 'less', -5),
+    'speed': ('plasma_speed', 'greater', 500),
+    'density': ('proton_density', 'greater', 10),
+    'dst': ('dst_index', 'less', -50),
+}
+SOURCE = 'latest.dat'
+LOG_PATH = os.environ.get('COSMOS_ALERT_LOG', 'alerts.jsonl')
+STATE_PATH = os.environ.get('COSMOS_ALERT_STATE', 'alerts_state.json')
+# Closed periods kept per rule in the state file
+MAX_PERIODS = 500
+
+
+def _iso(t):
+    return str(np.datetime64(t, 's'))
+
+
+def _time(text):
+    return np.datetime64(text, 'ns')
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+def _columns(rules):
+    return ['datetime'] + sorted({rule[0] for rule in rules.values()})
+
+
+def _hash(hashes, dataset, rows):
+    for column, h in hashes.items():
+        h.update(np.ascontiguousarray(dataset[column][rows]).tobytes())
+
+
+def _hexdigest(hashes):
+    return hashlib.blake2b(b''.join(h.digest() for h in hashes.values()), digest_size=16).hexdigest()
+
+
+def data_digest(dataset, rules=None):
+    """Fingerprint of the rule columns of ``dataset``.
+
+    The monitor keeps the same fingerprint of the rows it has evaluated, so
+    a page (or a restarted daemon) can tell whether the saved state was
+    computed from the data it has, or from rows since rewritten.
+    """
+    columns = _columns({name: tuple(rule) for name, rule in (rules or DEFAULT_RULES).items()})
+
+    def compute():
+        hashes = {column: hashlib.blake2b(digest_size=16) for column in columns}
+        _hash(hashes, dataset, slice(None))
+        return np.array(_hexdigest(hashes))
+
+    return str(dataset.derive(f'alert_digest:{",".join(columns)}', compute))
+
+
+class AlertMonitor:
+    """Open and closed alert periods of every rule, advanced batch by batch.
+
+    ``update()`` only looks at the rows after the last timestamp it has
+    seen, so a tick with one new hourly row costs a few small array
+    operations per rule however long the file is. A running fingerprint of
+    the evaluated rows is kept with the state; after ``recheck()`` (the file
+    was reloaded) or a restore, the next update compares it with the data and
+    starts over if earlier rows have changed.
+    """
+
+    def __init__(self, rules=None, state=None):
+        self.rules = {name: tuple(rule) for name, rule in (rules or DEFAULT_RULES).items()}
+        self._reset()
+        if state is not None and self._same_rules(state):
+            self._restore(state)
+
+    def _reset(self):
+        self.last_time = None
+        # name -> [start, last] of the period still open at ``last_time``
+        self.open = {}
+        self.periods = {name: [] for name in self.rules}
+        self.digest = None
+        self._hashes = {column: hashlib.blake2b(digest_size=16) for column in _columns(self.rules)}
+
+    def recheck(self):
+        """Verify the rows already evaluated against the data on the next update."""
+        self._hashes = None
+
+    def _same_rules(self, state):
+        saved = state.get('rules', {})
+        return saved.keys() == self.rules.keys() and all(tuple(saved[name]['rule']) == rule for name, rule in self.rules.items())
+
+    def _restore(self, state):
+        if state.get('last_time') is not None:
+            self.last_time = _time(state['last_time'])
+            self.digest = state.get('digest')
+            self._hashes = None
+        for name, saved in state['rules'].items():
+            if saved['open']:
+                self.open[name] = [_time(t) for t in saved['open']]
+            self.periods[name] = [[_time(start), _time(end)] for start, end in saved['periods']]
+
+    def _event(self, kind, name, t):
+        column, condition, threshold, *_ = self.rules[name]
+        return {'event': kind, 'rule': name, 'time': _iso(t), 'column': column,
+                'condition': condition, 'threshold': threshold, 'emitted': _now()}
+
+    def _close(self, name):
+        self.periods[name].append(self.open.pop(name))
+        del self.periods[name][:-MAX_PERIODS]
+
+    def update(self, dataset):
+        """Evaluate the rows of ``dataset`` newer than the last one seen.
+
+        Returns the alert start and end events, oldest first. An alert ends
+        at its last matching row, once a row that doesn't match arrives. If
+        the rows already evaluated have changed, every row is evaluated
+        again but only events after the previous last row are returned.
+        """
+        first = 0 if self.last_time is None else dataset.index.position(self.last_time, 'right')
+        if self._hashes is None:
+            hashes = {column: hashlib.blake2b(digest_size=16) for column in _columns(self.rules)}
+            _hash(hashes, dataset, slice(0, first))
+            if _hexdigest(hashes) == self.digest:
+                self._hashes = hashes
+            else:
+                seen = self.last_time
+                self._reset()
+                return [event for event in self.update(dataset) if seen is None or _time(event['time']) > seen]
+        times = dataset['datetime'][first:]
+        if not len(times):
+            return []
+        _hash(self._hashes, dataset, slice(first, None))
+        self.digest = _hexdigest(self._hashes)
+        events = []
+        for name, (column, condition, threshold, *rest) in self.rules.items():
+            current = self.open.get(name)
+            mask = threshold_mask(dataset[column][first:], threshold, condition, rest[0] if rest else None,
+                                  already_open=current is not None)
+            if current is not None and not mask[0]:
+                events.append(self._event('end', name, current[1]))
+                self._close(name)
+                current = None
+            for start, end in find_periods(mask):
+                if current is None:
+                    current = self.open[name] = [times[start], times[end]]
+                    events.append(self._event('start', name, times[start]))
+                else:
+                    current[1] = times[end]
+                if end < len(times) - 1:
+                    events.append(self._event('end', name, times[end]))
+                    self._close(name)
+                    current = None
+        self.last_time = times[-1]
+        events.sort(key=lambda event: event['time'])
+        return events
+
+    def state(self, source=None):
+        """JSON-ready snapshot; ``AlertMonitor(rules, state)`` continues from it."""
+        return {
+            'source': source,
+            'updated': _now(),
+            'last_time': None if self.last_time is None else _iso(self.last_time),
+            'digest': self.digest,
+            'rules': {
+                name: {
+                    'rule': list(rule),
+                    'open': [_iso(t) for t in self.open[name]] if name in self.open else None,
+                    'periods': [[_iso(start), _iso(end)] for start, end in self.periods[name]],
+                }
+                for name, rule in self.rules.items()
+            },
+        }
+
+
+def read_state(path=STATE_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_state(state, path=STATE_PATH):
+    # Replace atomically so readers never see a half-written file
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def append_events(events, path=LOG_PATH):
+    with open(path, 'a') as f:
+        for event in events:
+            f.write(json.dumps(event) + '\n')
+
+
+def post_events(events, url):
+    request = urllib.request.Request(url, data=json.dumps(events).encode(), method='POST',
+                                     headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=10):
+            pass
+    except OSError as e:
+        print(f'webhook {url} failed: {e}', file=sys.stderr)
+
+
+def fresh_state(dataset, rules=None, path=STATE_PATH):
+    """The daemon's state if it was computed from exactly the rows of ``dataset``
+    with ``rules``, else None."""
+    state = read_state(path)
+    if state is None or state.get('last_time') is None or not len(dataset):
+        return None
+    if dataset.version is not None and state.get('source') != dataset.version[0]:
+        return None
+    if not AlertMonitor(rules)._same_rules(state) or _time(state['last_time']) != dataset['datetime'][-1]:
+        return None
+    if state.get('digest') != data_digest(dataset, rules):
+        # latest.dat was rewritten since one of the two read it
+        return None
+    return state
+
+
+def window_periods(state, name, dataset, start, end):
+    """Periods of rule ``name`` clipped to the rows of ``dataset`` in [start, end].
+
+    Gives the same (start, end) Timestamps as ``threshold_periods`` on the
+    window, open period included.
+    """
+    saved = state['rules'][name]
+    periods = saved['periods'] + ([saved['open']] if saved['open'] else [])
+    start, end = _time(start), _time(end)
+    times = dataset['datetime']
+    out = []
+    for first, last in periods:
+        rows = dataset.index.slice(max(_time(first), start), min(_time(last), end))
+        if rows.stop > rows.start:
+            out.append((pd.Timestamp(times[rows.start]), pd.Timestamp(times[rows.stop - 1])))
+    return out
+
+
+async def watch(path=SOURCE, rules=None, interval=60, log_path=LOG_PATH, state_path=STATE_PATH, webhook=None, once=False):
+    """Evaluate new rows of ``path`` every ``interval`` seconds.
+
+    Without a saved state the existing rows only prime the monitor: alerts
+    already open are recorded but no events are emitted for the past.
+    """
+    from utils.loader import TailLoader
+
+    source = os.path.abspath(path)
+    loader = TailLoader(path)
+    state = read_state(state_path)
+    monitor = AlertMonitor(rules, state if state and state.get('source') == source else None)
+    primed = monitor.last_time is not None
+    posts = set()
+    reloads = 0
+    while True:
+        dataset = await asyncio.to_thread(loader.snapshot)
+        if loader.reloads != reloads:
+            # The whole file was read again, maybe rewritten
+            reloads = loader.reloads
+            monitor.recheck()
+        seen = monitor.last_time, monitor.digest
+        started = time.perf_counter()
+        events = monitor.update(dataset)
+        elapsed = time.perf_counter() - started
+        if not primed:
+            events, primed = [], True
+        if (monitor.last_time, monitor.digest) != seen:
+            write_state(monitor.state(source), state_path)
+            print(f'{_iso(monitor.last_time)}: {len(events)} events, evaluated in {elapsed * 1e6:.0f} us', flush=True)
+        if events:
+            append_events(events, log_path)
+            if webhook:
+                # Posted in the background so a slow endpoint doesn't delay the next tick
+                task = asyncio.create_task(asyncio.to_thread(post_events, events, webhook))
+                posts.add(task)
+                task.add_done_callback(posts.discard)
+        if once:
+            await asyncio.gather(*posts)
+            return monitor
+        await asyncio.sleep(interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', nargs='?', default=SOURCE)
+    parser.add_argument('--interval', type=float, default=60, help='seconds between checks for new rows')
+    parser.add_argument('--rules', help='JSON file of {name: [column, condition, threshold, exit_threshold?]}')
+    parser.add_argument('--log', default=LOG_PATH, help='JSONL file the events are appended to')
+    parser.add_argument('--state', default=STATE_PATH)
+    parser.add_argument('--webhook', help='URL each batch of events is POSTed to')
+    parser.add_argument('--once', action='store_true', help='evaluate the new rows once and exit')
+    args = parser.parse_args()
+
+    rules = None
+    if args.rules:
+        with open(args.rules) as f:
+            rules = json.load(f)
+    try:
+        asyncio.run(watch(args.path, rules, args.interval, args.log, args.state, args.webhook, args.once))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,311 @@
+"""Local range-query service over the OMNI dataset.
+
+Notebooks and batch jobs ask the service for a time range, a column list and
+a resolution instead of parsing the .dat files themselves. The dataset stays
+resident in the server, memory-mapped from the columnar cache, and responses
+are streamed in chunks straight from the column buffers, either as an Arrow
+IPC stream or as consecutive .npy arrays.
+
+    python -m utils.api --port 8502
+
+    GET /columns
+    GET /data?start=2003-10-28&end=2003-11-02&columns=bz_gsm,dst_index&resolution=raw&format=arrow
+
+Raw rows are selected with ``start <= datetime <= end``; daily and monthly
+buckets by the day or month of ``start`` and ``end``. From Python::
+
+    from utils.api import Client
+    df = Client().frame('2003-10-28', '2003-11-02', ['bz_gsm', 'dst_index'])
+"""
+import argparse
+import json
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from utils.loader import HISTORY_SOURCE, load_dataset, source_version
+from utils.rollup import LEVELS, Rollup
+
+try:
+    import pyarrow as pa
+except ImportError:
+    # Only the Arrow format needs it; .npy responses still work
+    pa = None
+
+HOST = '127.0.0.1'
+PORT = 8502
+# Rows per Arrow record batch and bytes per HTTP chunk
+BATCH_ROWS = 65536
+CHUNK_BYTES = 1 << 20
+# resolution -> Rollup level, None for the hourly rows
+RESOLUTIONS = {'raw': None, 'daily': 'day', 'monthly': 'month'}
+STATS = ('mean', 'std', 'min', 'max', 'count', 'sum', 'sumsq')
+FORMATS = {'arrow': 'application/vnd.apache.arrow.stream', 'npy': 'application/octet-stream'}
+
+
+class QueryError(ValueError):
+    """A query the service can't answer; reported as HTTP 400."""
+
+
+def _time(value, unit=None):
+    if value is None:
+        return None
+    try:
+        return np.datetime64(value, unit) if unit else np.datetime64(value)
+    except ValueError:
+        raise QueryError(f'Invalid time {value!r}') from None
+
+
+class Service:
+    """Answers range queries from the resident dataset of ``source``.
+
+    The dataset is reloaded when the files behind ``source`` change; the
+    rollup for daily and monthly queries is built on first use.
+    """
+
+    def __init__(self, source=HISTORY_SOURCE):
+        self.source = source
+        self._lock = threading.Lock()
+        self._dataset = None
+        self._rollup = None
+
+    def dataset(self):
+        with self._lock:
+            if self._dataset is None or self._dataset.version != source_version(self.source):
+                self._dataset = load_dataset(self.source)
+                self._rollup = None
+            return self._dataset
+
+    def rollup(self, dataset):
+        with self._lock:
+            if self._rollup is None or self._rollup[0] is not dataset:
+                self._rollup = (dataset, Rollup(dataset['datetime'], {col: dataset[col] for col in dataset.numeric_columns()}))
+            return self._rollup[1]
+
+    def describe(self):
+        dataset = self.dataset()
+        times = dataset['datetime']
+        return {
+            'source': self.source,
+            'version': str(dataset.version),
+            'rows': len(dataset),
+            'start': str(times[0]) if len(times) else None,
+            'end': str(times[-1]) if len(times) else None,
+            'columns': {name: str(values.dtype) for name, values in dataset.columns.items()},
+            'resolutions': list(RESOLUTIONS),
+            'stats': list(STATS),
+            'formats': [name for name in FORMATS if name != 'arrow' or pa is not None],
+        }
+
+    def query(self, start=None, end=None, columns=None, resolution='raw', stat='mean'):
+        """``{'datetime': ..., column: ...}`` arrays for the requested range.
+
+        Raw columns are views of the resident arrays, so nothing is copied
+        until the response is written.
+        """
+        if resolution not in RESOLUTIONS:
+            raise QueryError(f'resolution must be one of {", ".join(RESOLUTIONS)}')
+        if stat not in STATS:
+            raise QueryError(f'stat must be one of {", ".join(STATS)}')
+        dataset = self.dataset()
+        names = list(columns) if columns else dataset.numeric_columns()
+        level = RESOLUTIONS[resolution]
+        available = dataset.columns if level is None else dataset.numeric_columns()
+        unknown = [name for name in names if name not in available or name == 'datetime']
+        if unknown:
+            raise QueryError(f'Unknown columns for {resolution} data: {", ".join(unknown)}')
+
+        if level is None:
+            rows = dataset.index.slice(_time(start), _time(end))
+            return {'datetime': dataset['datetime'][rows], **{name: dataset[name][rows] for name in names}}
+
+        rollup = self.rollup(dataset)
+        keys = rollup.keys[level]
+        lo = 0 if start is None else np.searchsorted(keys, _time(start, LEVELS[level]), 'left')
+        hi = len(keys) if end is None else np.searchsorted(keys, _time(end, LEVELS[level]), 'right')
+        out = {'datetime': keys[lo:hi].astype('datetime64[ns]')}
+        for name in names:
+            out[name] = rollup.values(level, name, stat)[lo:hi]
+        return out
+
+
+class ChunkedWriter:
+    """File-like object writing HTTP/1.1 chunked transfer encoding."""
+
+    def __init__(self, wfile, chunk_bytes=CHUNK_BYTES):
+        self.wfile = wfile
+        self.chunk_bytes = chunk_bytes
+        self.buffer = bytearray()
+        self.closed = False
+
+    def write(self, data):
+        data = memoryview(data).cast('B')
+        if len(self.buffer) + len(data) < self.chunk_bytes:
+            self.buffer += data
+        else:
+            self.flush()
+            self._chunk(data)
+        return len(data)
+
+    def _chunk(self, data):
+        if len(data):
+            self.wfile.write(b'%X\r\n' % len(data))
+            self.wfile.write(data)
+            self.wfile.write(b'\r\n')
+
+    def flush(self):
+        self._chunk(self.buffer)
+        self.buffer = bytearray()
+
+    def close(self):
+        if not self.closed:
+            self.flush()
+            self.wfile.write(b'0\r\n\r\n')
+            self.closed = True
+
+
+def write_arrow(columns, out, batch_rows=BATCH_ROWS):
+    """Write ``columns`` to ``out`` as an Arrow IPC stream, one batch at a time.
+
+    NumPy buffers are wrapped, not converted: NaN stays NaN and datetimes
+    become timestamp[ns].
+    """
+    names = list(columns)
+    schema = pa.schema([(name, pa.from_numpy_dtype(columns[name].dtype)) for name in names])
+    n = len(columns['datetime'])
+    with pa.ipc.new_stream(out, schema) as writer:
+        for start in range(0, n, batch_rows):
+            writer.write_batch(pa.record_batch([pa.array(columns[name][start:start + batch_rows]) for name in names], schema=schema))
+
+
+def write_npy(columns, out, chunk_bytes=CHUNK_BYTES):
+    """Write ``columns`` to ``out`` as consecutive .npy arrays, in order."""
+    for values in columns.values():
+        values = np.ascontiguousarray(values)
+        np.lib.format.write_array_header_1_0(out, np.lib.format.header_data_from_array_1_0(values))
+        raw = memoryview(values.view(np.uint8))
+        for start in range(0, len(raw), chunk_bytes):
+            out.write(raw[start:start + chunk_bytes])
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = {key: values[-1] for key, values in urllib.parse.parse_qs(url.query).items()}
+        service = self.server.service
+        try:
+            if url.path == '/columns':
+                self._json(200, service.describe())
+            elif url.path == '/data':
+                self._data(service, params)
+            else:
+                self._json(404, {'error': f'No such endpoint {url.path}'})
+        except QueryError as e:
+            self._json(400, {'error': str(e)})
+
+    def _data(self, service, params):
+        fmt = params.get('format', 'arrow')
+        if fmt not in FORMATS or (fmt == 'arrow' and pa is None):
+            raise QueryError(f'format must be one of {", ".join(service.describe()["formats"])}')
+        columns = service.query(params.get('start'), params.get('end'),
+                                [name for name in params.get('columns', '').split(',') if name],
+                                params.get('resolution', 'raw'), params.get('stat', 'mean'))
+        self.send_response(200)
+        self.send_header('Content-Type', FORMATS[fmt])
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('X-Columns', ','.join(columns))
+        self.send_header('X-Rows', str(len(columns['datetime'])))
+        self.end_headers()
+        out = ChunkedWriter(self.wfile)
+        try:
+            if fmt == 'arrow':
+                write_arrow(columns, out)
+            else:
+                write_npy(columns, out)
+            out.close()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading; nothing left to answer
+            self.close_connection = True
+
+    def _json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def make_server(source=HISTORY_SOURCE, host=HOST, port=PORT):
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.service = Service(source)
+    return server
+
+
+class Client:
+    """Python access to a running service."""
+
+    def __init__(self, url=f'http://{HOST}:{PORT}', timeout=60):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def _open(self, path, **params):
+        query = urllib.parse.urlencode({key: value for key, value in params.items() if value is not None})
+        try:
+            return urllib.request.urlopen(f'{self.url}{path}?{query}', timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.load(e)['error']
+            except ValueError:
+                message = str(e)
+            raise QueryError(message) from None
+
+    def _data(self, fmt, start, end, columns, resolution, stat):
+        return self._open('/data', start=start, end=end, columns=','.join(columns) if columns else None,
+                          resolution=resolution, stat=stat, format=fmt)
+
+    def columns(self):
+        with self._open('/columns') as response:
+            return json.load(response)
+
+    def table(self, start=None, end=None, columns=None, resolution='raw', stat='mean'):
+        """The query result as a pyarrow Table."""
+        with self._data('arrow', start, end, columns, resolution, stat) as response:
+            table = pa.ipc.open_stream(response).read_all()
+            # Consume the end of the chunked body so the server finishes cleanly
+            response.read()
+            return table
+
+    def frame(self, start=None, end=None, columns=None, resolution='raw', stat='mean'):
+        """The query result as a pandas DataFrame."""
+        return self.table(start, end, columns, resolution, stat).to_pandas()
+
+    def arrays(self, start=None, end=None, columns=None, resolution='raw', stat='mean'):
+        """The query result as a dict of NumPy arrays; doesn't need pyarrow."""
+        with self._data('npy', start, end, columns, resolution, stat) as response:
+            names = response.headers['X-Columns'].split(',')
+            return {name: np.lib.format.read_array(response) for name in names}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--source', default=HISTORY_SOURCE, help='.dat file, directory of yearly files or glob')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    args = parser.parse_args()
+
+    server = make_server(args.source, args.host, args.port)
+    # Load the dataset and build the rollup before the first query arrives
+    server.service.rollup(server.service.dataset())
+    print(f'serving {args.source} on http://{args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,93 @@
+import threading
+
+import numpy as np
+
+SUMS = ('n', 'x', 'y', 'xx', 'yy', 'xy')
+HISTOGRAM_BINS = 100
+
+
+def _month_starts(times):
+    months = np.asarray(times, dtype='datetime64[ns]').astype('datetime64[M]')
+    starts = np.flatnonzero(np.concatenate(([True], months[1:] != months[:-1])))
+    return months[starts], starts
+
+
+class PairStats:
+    """Per-month sufficient statistics for every pair of columns.
+
+    For each pair and month it keeps n, Σx, Σy, Σx², Σy² and Σxy over the rows
+    where both values are present. Pearson r and the OLS fit for any range of
+    months are then sums over a few hundred rows. A 2D histogram of every
+    pair replaces plotting the raw points. ``add_column()`` only needs one
+    pass over the new column against each existing one.
+    """
+
+    def __init__(self, times, columns=None, bins=HISTOGRAM_BINS):
+        self.months, self.starts = _month_starts(times)
+        self.bins = bins
+        self.columns = {}
+        self.sums = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+        for name, values in (columns or {}).items():
+            self.add_column(name, values)
+
+    def add_column(self, name, values):
+        with self.lock:
+            if name in self.columns:
+                return
+            values = np.asarray(values, dtype='float64')
+            self.columns[name] = values
+            for other, other_values in self.columns.items():
+                self._add_pair(other, name, other_values, values)
+
+    def _add_pair(self, a, b, x, y):
+        valid = ~(np.isnan(x) | np.isnan(y))
+        x = np.where(valid, x, 0.0)
+        y = np.where(valid, y, 0.0)
+        terms = {'n': valid.astype('float64'), 'x': x, 'y': y, 'xx': x * x, 'yy': y * y, 'xy': x * y}
+        self.sums[a, b] = np.column_stack([np.add.reduceat(terms[s], self.starts) for s in SUMS])
+
+        # Clip the histogram to the central 99% so outliers don't squash it
+        lo = np.quantile(x[valid], [0.005, 0.995]) if valid.any() else [0, 1]
+        hi = np.quantile(y[valid], [0.005, 0.995]) if valid.any() else [0, 1]
+        counts, x_edges, y_edges = np.histogram2d(x[valid], y[valid], bins=self.bins, range=[lo, hi])
+        self.histograms[a, b] = (counts, x_edges, y_edges)
+
+    def _pair(self, a, b):
+        if (a, b) in self.sums:
+            return False, self.sums[a, b]
+        return True, self.sums[b, a]
+
+    def totals(self, a, b, start=None, end=None):
+        """Summed statistics of x=``a``, y=``b`` over the months in [start, end]."""
+        swapped, sums = self._pair(a, b)
+        lo = 0 if start is None else np.searchsorted(self.months, np.datetime64(start, 'M'))
+        hi = len(self.months) if end is None else np.searchsorted(self.months, np.datetime64(end, 'M'), side='right')
+        totals = dict(zip(SUMS, sums[lo:hi].sum(axis=0)))
+        if swapped:
+            totals['x'], totals['y'] = totals['y'], totals['x']
+            totals['xx'], totals['yy'] = totals['yy'], totals['xx']
+        return totals
+
+    def regression(self, a, b, start=None, end=None):
+        """Pearson r, OLS slope and intercept of ``b`` on ``a`` and the row count."""
+        t = self.totals(a, b, start, end)
+        n = t['n']
+        if n < 2:
+            return {'n': int(n), 'r': np.nan, 'slope': np.nan, 'intercept': np.nan}
+        sxx = t['xx'] - t['x'] * t['x'] / n
+        syy = t['yy'] - t['y'] * t['y'] / n
+        sxy = t['xy'] - t['x'] * t['y'] / n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            slope = sxy / sxx
+            r = sxy / np.sqrt(sxx * syy)
+        return {'n': int(n), 'r': r, 'slope': slope, 'intercept': (t['y'] - slope * t['x']) / n}
+
+    def histogram(self, a, b):
+        """``(counts, x_edges, y_edges)`` with x=``a`` along the first axis."""
+        swapped, _ = self._pair(a, b)
+        if not swapped:
+            return self.histograms[a, b]
+        counts, x_edges, y_edges = self.histograms[b, a]
+        return counts.T, y_edges, x_edges
@@ -0,0 +1,60 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.timeindex import TimeIndex
+
+# Columns that describe the time of a row rather than a measurement
+TIME_COLUMNS = ('year', 'day', 'hour', 'datetime')
+
+
+def _read_only(values):
+    view = np.asarray(values).view()
+    view.flags.writeable = False
+    return view
+
+
+class Dataset:
+    """Immutable OMNI dataset shared by every session and page.
+
+    Columns are read-only NumPy arrays, usually memory-mapped from the
+    columnar cache, so handing the dataset to another session costs nothing.
+    ``frame()`` wraps views of them in a DataFrame without copying. Derived
+    columns are computed once on first use and shared the same way.
+    """
+
+    def __init__(self, columns, index=None, version=None):
+        self.columns = {name: _read_only(values) for name, values in columns.items()}
+        self.index = index if index is not None else TimeIndex(self.columns['datetime'])
+        self.version = version
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.columns['datetime'])
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def derive(self, key, compute):
+        """Return the cached array for ``key``, computing it once if needed."""
+        values = self._derived.get(key)
+        if values is None:
+            with self._lock:
+                values = self._derived.get(key)
+                if values is None:
+                    values = self._derived[key] = _read_only(compute())
+        return values
+
+    def numeric_columns(self):
+        return [name for name in self.columns if name not in TIME_COLUMNS]
+
+    def frame(self, columns=None, rows=None):
+        """DataFrame of views over ``columns`` (default all) for the ``rows`` slice."""
+        rows = slice(None) if rows is None else rows
+        columns = list(self.columns) if columns is None else columns
+        return pd.DataFrame({name: self[name][rows] for name in columns}, copy=False)
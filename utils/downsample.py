@@ -0,0 +1,85 @@
+import numpy as np
+
+# Roughly two points per horizontal pixel of a full-width chart
+MAX_POINTS = 2000
+
+
+def _buckets(values, n_buckets, fill):
+    """Pad ``values`` with ``fill`` and reshape into ``n_buckets`` equal rows."""
+    size = -(-len(values) // n_buckets)
+    padded = np.full(n_buckets * size, fill, dtype='float64')
+    padded[:len(values)] = values
+    return padded.reshape(n_buckets, size), size
+
+
+def minmax_indices(y, max_points=MAX_POINTS):
+    """Indices keeping the minimum and maximum of every bucket.
+
+    Spikes survive because the extreme of each bucket is always kept. Buckets
+    holding only NaN keep their first sample so gaps still show up.
+    """
+    y = np.asarray(y, dtype='float64')
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+    n_buckets = max(max_points // 2, 1)
+    nan = np.isnan(y)
+    lows, size = _buckets(np.where(nan, np.inf, y), n_buckets, np.inf)
+    highs, _ = _buckets(np.where(nan, -np.inf, y), n_buckets, -np.inf)
+    base = np.arange(n_buckets) * size
+    idx = np.concatenate((base + lows.argmin(axis=1), base + highs.argmax(axis=1)))
+    return np.unique(idx[idx < n])
+
+
+def lttb_indices(y, x=None, max_points=MAX_POINTS):
+    """Largest-Triangle-Three-Buckets indices of the series.
+
+    The first and last points are always kept; every bucket in between keeps
+    the point forming the largest triangle with the previously kept point
+    and the mean of the next bucket. The work inside each bucket is
+    vectorized, leaving one short loop over the ``max_points`` buckets.
+    """
+    y = np.asarray(y, dtype='float64')
+    n = len(y)
+    if n <= max_points or max_points < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype='float64') if x is None else np.asarray(x).astype('float64')
+
+    edges = np.linspace(1, n - 1, max_points - 1).astype('int64')
+    # Means of every bucket, used as the third vertex of the triangle
+    counts = np.diff(edges)
+    valid = ~np.isnan(y)
+    sum_x = np.add.reduceat(np.where(valid, x, 0.0), edges[:-1])
+    sum_y = np.add.reduceat(np.where(valid, y, 0.0), edges[:-1])
+    n_valid = np.add.reduceat(valid.astype('int64'), edges[:-1])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_x = np.where(n_valid > 0, sum_x / n_valid, np.add.reduceat(x, edges[:-1]) / counts)
+        mean_y = np.where(n_valid > 0, sum_y / n_valid, np.nan)
+
+    idx = np.empty(max_points, dtype='int64')
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(max_points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 1 < len(mean_x):
+            cx, cy = mean_x[i + 1], mean_y[i + 1]
+        else:
+            cx, cy = x[-1], y[-1]
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        area = np.where(np.isnan(area), -1.0, area)
+        a = lo + int(area.argmax())
+        idx[i + 1] = a
+    return idx
+
+
+def decimate(x, y, max_points=MAX_POINTS, method='minmax'):
+    """Downsample a trace to at most about ``max_points`` points."""
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if method == 'minmax':
+        idx = minmax_indices(y, max_points)
+    elif method == 'lttb':
+        idx = lttb_indices(y, x.astype('int64') if x.dtype.kind == 'M' else x, max_points)
+    else:
+        raise ValueError("method must be 'minmax' or 'lttb'")
+    return x[idx], y[idx]
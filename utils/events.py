@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+
+CONDITIONS = {'less': np.less, '<': np.less, 'greater': np.greater, '>': np.greater}
+
+
+def _compare(values, threshold, condition):
+    try:
+        op = CONDITIONS[condition]
+    except KeyError:
+        raise ValueError("Condition must be 'less' or 'greater'") from None
+    with np.errstate(invalid='ignore'):
+        return op(np.asarray(values, dtype='float64'), threshold)
+
+
+def _run_bounds(mask):
+    """Return (starts, ends) of the True runs in ``mask``, ends inclusive."""
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return edges[0::2], edges[1::2] - 1
+
+
+def threshold_mask(values, threshold, condition='less', exit_threshold=None, already_open=False):
+    """Boolean mask of the samples where ``values`` meets the condition.
+
+    With ``exit_threshold`` the mask has hysteresis: a period opens when the
+    value crosses ``threshold`` and stays open until it crosses back over
+    ``exit_threshold`` (e.g. enter below -5 nT, exit above -3 nT).
+    ``already_open`` says a period was open before ``values[0]``, so a long
+    series can be evaluated one chunk at a time.
+    """
+    enter = _compare(values, threshold, condition)
+    if exit_threshold is None:
+        return enter
+    stay = _compare(values, exit_threshold, condition) | enter
+    if already_open and len(stay) and stay[0]:
+        enter[0] = True
+
+    # Inside every run of ``stay`` the period is open from the first entering
+    # sample to the end of the run.
+    starts, _ = _run_bounds(stay)
+    if not len(starts):
+        return stay
+    entered = np.cumsum(enter)
+    before_run = np.where(starts > 0, entered[starts - 1], 0)
+    marker = np.zeros(len(stay), dtype='int64')
+    marker[starts] = 1
+    run_id = np.maximum(np.cumsum(marker) - 1, 0)
+    return stay & (entered - before_run[run_id] > 0)
+
+
+def combine(masks, how='and'):
+    """Combine several masks with AND / OR."""
+    if how == 'and':
+        return np.logical_and.reduce(masks)
+    if how == 'or':
+        return np.logical_or.reduce(masks)
+    raise ValueError("how must be 'and' or 'or'")
+
+
+def find_periods(mask, min_duration=1, max_gap=0):
+    """Return an ``(n, 2)`` array of inclusive [start, end] indices of True runs.
+
+    Runs separated by at most ``max_gap`` False samples are merged, then runs
+    shorter than ``min_duration`` samples are dropped.
+    """
+    starts, ends = _run_bounds(np.asarray(mask, dtype=bool))
+    if max_gap > 0 and len(starts) > 1:
+        keep = np.concatenate(([True], starts[1:] - ends[:-1] - 1 > max_gap))
+        starts = starts[keep]
+        ends = ends[np.concatenate((keep[1:], [True]))]
+    periods = np.column_stack((starts, ends))
+    if min_duration > 1:
+        periods = periods[periods[:, 1] - periods[:, 0] + 1 >= min_duration]
+    return periods
+
+
+def rule_mask(df, rule):
+    """Mask for one ``(column, condition, threshold[, exit_threshold])`` rule."""
+    column, condition, threshold, *rest = rule
+    exit_threshold = rest[0] if rest else None
+    return threshold_mask(df[column].to_numpy(), threshold, condition, exit_threshold)
+
+
+def detect(df, rules, how='and', min_duration=1, max_gap=0):
+    """Periods where the combined ``rules`` hold, as a list of (start, end) times.
+
+    e.g. ``detect(df, [('bz_gsm', '<', -5), ('plasma_speed', '>', 500)])``
+    """
+    mask = combine([rule_mask(df, rule) for rule in rules], how)
+    periods = find_periods(mask, min_duration, max_gap)
+    times = df['datetime'].to_numpy()
+    return [(pd.Timestamp(times[start]), pd.Timestamp(times[end])) for start, end in periods]
+
+
+def threshold_periods(df, column, threshold, condition='less', exit_threshold=None, min_duration=1, max_gap=0):
+    return detect(df, [(column, condition, threshold, exit_threshold)], 'and', min_duration, max_gap)
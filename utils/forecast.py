@@ -0,0 +1,139 @@
+import os
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Parameters the model reads and forecasts
+COLUMNS = ('bz_gsm', 'plasma_speed', 'proton_density', 'dst_index', 'kp')
+# Hours of history fed to the model
+LAGS = 24
+# Forecast horizons in hours: one per day for five days
+HORIZONS = (24, 48, 72, 96, 120)
+# Ridge penalty, relative to the number of training rows
+RIDGE = 1e-3
+# Rows per training chunk; bounds the memory of the lagged feature matrix
+CHUNK = 20000
+
+HOUR = np.timedelta64(1, 'h')
+
+
+def _standardized(dataset, mean, std):
+    return np.column_stack([(np.asarray(dataset[col], dtype='float64') - m) / s for col, m, s in zip(COLUMNS, mean, std)])
+
+
+def _features(windows):
+    """Flatten ``(m, LAGS, k)`` windows into design rows with an intercept column."""
+    m = len(windows)
+    return np.concatenate((np.ones((m, 1)), windows.reshape(m, -1)), axis=1)
+
+
+def train(dataset, lags=LAGS, horizons=HORIZONS, ridge=RIDGE, chunk=CHUNK):
+    """Fit one multi-output ridge model for every column and horizon.
+
+    The design matrix holds the last ``lags`` hours of every column,
+    standardised, and is built as strided windows one chunk at a time. Only
+    XᵀX and XᵀY are accumulated, so memory stays bounded by the chunk size
+    however long the history is. Windows that span a gap in the hourly
+    series are skipped.
+    """
+    mean = np.array([np.nanmean(dataset[col]) for col in COLUMNS])
+    std = np.array([np.nanstd(dataset[col]) for col in COLUMNS])
+    std[std == 0] = 1
+    values = _standardized(dataset, mean, std)
+    hours = np.asarray(dataset['datetime']).astype('datetime64[h]').astype('int64')
+    k = len(COLUMNS)
+    horizons = np.asarray(horizons)
+    reach = int(horizons.max())
+
+    n_features = 1 + lags * k
+    xtx = np.zeros((n_features, n_features))
+    xty = np.zeros((n_features, k * len(horizons)))
+    rows = 0
+    # ``t`` is the last hour of history of a sample
+    for start in range(lags - 1, len(values) - reach, chunk):
+        t = np.arange(start, min(start + chunk, len(values) - reach))
+        contiguous = (hours[t] - hours[t - lags + 1] == lags - 1) & (hours[t + reach] - hours[t] == reach)
+        windows = sliding_window_view(values[t[0] - lags + 1:t[-1] + 1], lags, axis=0).transpose(0, 2, 1)
+        targets = values[t[:, None] + horizons].reshape(len(t), -1)
+        ok = contiguous & ~np.isnan(windows).any(axis=(1, 2)) & ~np.isnan(targets).any(axis=1)
+        if not ok.any():
+            continue
+        x = _features(windows[ok])
+        xtx += x.T @ x
+        xty += x.T @ targets[ok]
+        rows += int(ok.sum())
+    if not rows:
+        raise ValueError('No complete windows to train the forecast model on')
+
+    penalty = np.full(n_features, ridge * rows)
+    penalty[0] = 0  # the intercept is not shrunk
+    weights = np.linalg.solve(xtx + np.diag(penalty), xty)
+    return {'weights': weights, 'mean': mean, 'std': std, 'lags': lags, 'horizons': horizons,
+            'rows': rows, 'version': str(dataset.version)}
+
+
+def save(model, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + '.tmp.npz'
+    np.savez(tmp, **model)
+    os.replace(tmp, path)
+
+
+def load(path, version=None):
+    """Load a saved model, or None if it is missing or trained on other data."""
+    try:
+        with np.load(path) as f:
+            model = {name: f[name] for name in f.files}
+    except (OSError, ValueError):
+        return None
+    if version is not None and str(model['version']) != str(version):
+        return None
+    model['lags'] = int(model['lags'])
+    model['rows'] = int(model['rows'])
+    return model
+
+
+def recent_window(dataset, lags=LAGS):
+    """The last ``lags`` observed hours of COLUMNS as a ``(lags, k)`` array.
+
+    The window ends at the last row with any COLUMNS data, so trailing fill
+    rows are skipped; hours without data inside the window are NaN.
+    """
+    observed = np.zeros(len(dataset), dtype=bool)
+    for col in COLUMNS:
+        observed |= ~np.isnan(dataset[col])
+    last = np.flatnonzero(observed)
+    end = dataset['datetime'][last[-1] if len(last) else -1]
+    rows = dataset.index.slice(end - (lags - 1) * HOUR, end)
+    window = np.full((lags, len(COLUMNS)), np.nan)
+    offsets = ((dataset['datetime'][rows] - end) // HOUR).astype('int64') + lags - 1
+    for j, col in enumerate(COLUMNS):
+        window[offsets, j] = dataset[col][rows]
+    return window, end
+
+
+def predict(model, windows):
+    """Forecast every column at every horizon for a batch of windows.
+
+    ``windows`` is ``(m, lags, k)`` (or a single ``(lags, k)`` window) of raw
+    values. Missing values are treated as the training mean. Returns
+    ``(m, horizons, k)`` (or ``(horizons, k)``).
+    """
+    windows = np.asarray(windows, dtype='float64')
+    single = windows.ndim == 2
+    if single:
+        windows = windows[None]
+    scaled = np.nan_to_num((windows - model['mean']) / model['std'])
+    out = _features(scaled) @ model['weights']
+    out = out.reshape(len(windows), len(model['horizons']), len(COLUMNS)) * model['std'] + model['mean']
+    return out[0] if single else out
+
+
+if __name__ == '__main__':
+    # Train and save the model: python -m utils.forecast
+    from utils.loader import HISTORY_SOURCE, forecast_model_path, load_dataset
+
+    dataset = load_dataset(HISTORY_SOURCE)
+    model = train(dataset)
+    save(model, forecast_model_path(HISTORY_SOURCE))
+    print(f"trained on {model['rows']} windows -> {forecast_model_path(HISTORY_SOURCE)}")
@@ -1,27 +1,485 @@
+import glob
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
 
-import streamlit as st
+import numpy as np
 import pandas as pd
+import streamlit as st
+
+from utils import forecast, profiling, storms
+from utils.dataset import Dataset
+from utils.rolling import RollingCache
+from utils.timeindex import TimeIndex
+
+# OMNI hourly column layout (see the format table in reader.ipynb):
+# (name, Fortran format, fill sentinel or None, in-memory dtype).
+# Columns with a fill sentinel are float32 so missing values can be NaN.
+SCHEMA = [
+    ('year', 'I4', None, 'int16'),
+    ('day', 'I4', None, 'int16'),
+    ('hour', 'I3', None, 'int8'),
+    ('bartels_rotation', 'I5', 9999, 'float32'),
+    ('id_imf_spacecraft', 'I3', 99, 'float32'),
+    ('id_sw_plasma_spacecraft', 'I3', 99, 'float32'),
+    ('n_imf_avg', 'I4', 999, 'float32'),
+    ('n_plasma_avg', 'I4', 999, 'float32'),
+    ('field_magnitude_avg', 'F6.1', 999.9, 'float32'),
+    ('magnitude_avg_field_vector', 'F6.1', 999.9, 'float32'),
+    ('lat_angle_avg_field_vector', 'F6.1', 999.9, 'float32'),
+    ('long_angle_avg_field_vector', 'F6.1', 999.9, 'float32'),
+    ('bx_gse', 'F6.1', 999.9, 'float32'),
+    ('by_gse', 'F6.1', 999.9, 'float32'),
+    ('bz_gse', 'F6.1', 999.9, 'float32'),
+    ('by_gsm', 'F6.1', 999.9, 'float32'),
+    ('bz_gsm', 'F6.1', 999.9, 'float32'),
+    ('sigma_field_magnitude', 'F6.1', 999.9, 'float32'),
+    ('sigma_field_vector', 'F6.1', 999.9, 'float32'),
+    ('sigma_bx', 'F6.1', 999.9, 'float32'),
+    ('sigma_by', 'F6.1', 999.9, 'float32'),
+    ('sigma_bz', 'F6.1', 999.9, 'float32'),
+    ('proton_temperature', 'F9.0', 9999999., 'float32'),
+    ('proton_density', 'F6.1', 999.9, 'float32'),
+    ('plasma_speed', 'F6.0', 9999., 'float32'),
+    ('plasma_flow_long_angle', 'F6.1', 999.9, 'float32'),
+    ('plasma_flow_lat_angle', 'F6.1', 999.9, 'float32'),
+    ('na_np', 'F6.3', 9.999, 'float32'),
+    ('flow_pressure', 'F6.2', 99.99, 'float32'),
+    ('sigma_t', 'F9.0', 9999999., 'float32'),
+    ('sigma_n', 'F6.1', 999.9, 'float32'),
+    ('sigma_v', 'F6.0', 9999., 'float32'),
+    ('sigma_phi_v', 'F6.1', 999.9, 'float32'),
+    ('sigma_theta_v', 'F6.1', 999.9, 'float32'),
+    ('sigma_na_np', 'F6.3', 9.999, 'float32'),
+    ('electric_field', 'F7.2', 999.99, 'float32'),
+    ('plasma_beta', 'F7.2', 999.99, 'float32'),
+    ('alfven_mach_number', 'F6.1', 999.9, 'float32'),
+    ('kp', 'I3', 99, 'float32'),
+    ('r', 'I4', 999, 'float32'),
+    ('dst_index', 'I6', 99999, 'float32'),
+    ('ae_index', 'I5', 9999, 'float32'),
+    ('proton_flux_1', 'F10.2', 999999.99, 'float32'),
+    ('proton_flux_2', 'F9.2', 99999.99, 'float32'),
+    ('proton_flux_4', 'F9.2', 99999.99, 'float32'),
+    ('proton_flux_10', 'F9.2', 99999.99, 'float32'),
+    ('proton_flux_30', 'F9.2', 99999.99, 'float32'),
+    ('proton_flux_60', 'F9.2', 99999.99, 'float32'),
+    ('flag', 'I3', None, 'int8'),
+    ('ap_index', 'I4', 999, 'float32'),
+    ('f10.7_index', 'F6.1', 999.9, 'float32'),
+    ('pc_n_index', 'F6.1', 999.9, 'float32'),
+    ('al_index', 'I6', 99999, 'float32'),
+    ('au_index', 'I6', 99999, 'float32'),
+    ('magnetosonic_mach_number', 'F5.1', 99.9, 'float32'),
+]
+
+cols = [name for name, _, _, _ in SCHEMA]
+
+# Parsed .dat files are stored next to the source as one .npy file per column,
+# so later loads can memory-map them instead of re-parsing the text.
+CACHE_DIR = '.omni_cache'
+# Bump whenever the on-disk layout or parsing rules change.
+CACHE_VERSION = 2
+
+# History shown on the Analysis page and used to train the forecast: a .dat
+# file, a directory of yearly omni2_YYYY.dat files or a glob of them
+HISTORY_SOURCE = os.environ.get('OMNI_HISTORY', 'here.dat')
+
+
+def source_signature(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'version': CACHE_VERSION}
+
+
+def cache_path(path):
+    path = os.path.abspath(path)
+    return os.path.join(os.path.dirname(path), CACHE_DIR, os.path.basename(path))
+
+
+def compute_datetime(year, day, hour):
+    """Build datetime64[ns] values from OMNI year / day-of-year / hour columns."""
+    years = (np.asarray(year, dtype='int64') - 1970).astype('datetime64[Y]')
+    days = years.astype('datetime64[D]') + (np.asarray(day, dtype='int64') - 1)
+    hours = days.astype('datetime64[h]') + np.asarray(hour, dtype='int64')
+    return hours.astype('datetime64[ns]')
+
+
+def parse_dat(path):
+    """Parse a whitespace separated OMNI .dat file into a dict of column arrays.
+
+    ``path`` may also be a file-like object holding OMNI lines. Lines that
+    don't have every field are dropped; fill sentinels become NaN and each
+    column is cast to its SCHEMA dtype.
+    """
+    raw = pd.read_csv(path, sep=r'\s+', header=None, names=cols, dtype='float64').to_numpy()
+    raw = raw[~np.isnan(raw).any(axis=1)]
+    columns = {}
+    for i, (name, _, fill, dtype) in enumerate(SCHEMA):
+        values = raw[:, i]
+        if fill is not None:
+            values = np.where(values == fill, np.nan, values)
+        columns[name] = values.astype(dtype)
+    columns['datetime'] = compute_datetime(columns['year'], columns['day'], columns['hour'])
+    return columns
+
+
+def _replace(target, name, write):
+    """Write ``name`` in ``target`` through a temp file only this call uses.
+
+    The app, the alert daemon and the API may build the same cache at once;
+    each publishes complete files with ``os.replace`` and never sees the
+    others' partial ones.
+    """
+    fd, tmp = tempfile.mkstemp(dir=target, prefix=f'{name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp, os.path.join(target, name))
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+@profiling.profiled('parse_to_cache')
+def build_cache(path):
+    """Parse ``path`` once and write its columns to the binary cache."""
+    # Stat before parsing: if the file grows meanwhile the cache is simply
+    # considered stale on the next read.
+    signature = source_signature(path)
+    columns = parse_dat(path)
+    target = cache_path(path)
+    os.makedirs(target, exist_ok=True)
+
+    # Invalidate first, write the columns, then publish the new meta last so a
+    # half-written cache is never picked up.
+    meta_file = os.path.join(target, 'meta.json')
+    try:
+        os.remove(meta_file)
+    except FileNotFoundError:
+        pass
+    for name, values in columns.items():
+        _replace(target, f'{name}.npy', lambda f: np.save(f, values))
+
+    meta = dict(signature, rows=len(columns['datetime']), columns=list(columns))
+    _replace(target, 'meta.json', lambda f: f.write(json.dumps(meta).encode()))
+    return columns
+
+
+def read_cache(path):
+    """Return the memory-mapped cached columns for ``path``, or None if stale."""
+    target = cache_path(path)
+    try:
+        with open(os.path.join(target, 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    signature = source_signature(path)
+    if any(meta.get(key) != value for key, value in signature.items()):
+        return None
+    try:
+        return {name: np.load(os.path.join(target, f'{name}.npy'), mmap_mode='r') for name in meta['columns']}
+    except (OSError, ValueError):
+        return None
+
+
+def load_columns(path):
+    columns = read_cache(path)
+    if columns is None:
+        columns = build_cache(path)
+    return columns
+
+
+def source_files(source):
+    """The .dat files behind ``source``: one file, a directory or a glob.
+
+    A directory stands for the yearly files upstream OMNI distributes
+    (omni2_YYYY.dat) and any other .dat files in it.
+    """
+    if os.path.isdir(source):
+        return sorted(glob.glob(os.path.join(source, '*.dat')))
+    if glob.has_magic(source):
+        return sorted(glob.glob(source))
+    return [source]
+
+
+def _build_cache_job(path):
+    # Runs in a worker process; only the row count travels back, the
+    # columns are read from the cache afterwards.
+    return len(build_cache(path)['datetime'])
+
+
+def build_caches(paths, workers=None):
+    """Re-parse the files of ``paths`` whose cache is stale, in parallel.
+
+    Returns the paths that were rebuilt. Workers are spawned rather than
+    forked because the app process runs threads.
+    """
+    stale = [path for path in paths if read_cache(path) is None]
+    workers = min(len(stale), workers or os.cpu_count() or 1)
+    with profiling.stage('parse_pool', rows=len(stale)):
+        if workers > 1:
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+                list(pool.map(_build_cache_job, stale))
+        else:
+            for path in stale:
+                build_cache(path)
+    return stale
+
+
+def merge_columns(parts):
+    """Concatenate per-file columns in time order.
+
+    Each column is written once into a preallocated array, straight from the
+    memory-mapped caches, so the merge costs a single copy of the data. A
+    lone part is returned as is. Where parts overlap, a timestamp keeps the
+    row of the last part given that has it, so pass the newest file last.
+    """
+    ranked = sorted((i for i, part in enumerate(parts) if len(part['datetime'])), key=lambda i: parts[i]['datetime'][0])
+    if len(ranked) <= 1:
+        return parts[ranked[0] if ranked else 0]
+    sizes = [len(parts[i]['datetime']) for i in ranked]
+    merged = {name: np.empty(sum(sizes), dtype=values.dtype) for name, values in parts[ranked[0]].items()}
+    start = 0
+    for i, size in zip(ranked, sizes):
+        for name, values in parts[i].items():
+            merged[name][start:start + size] = values
+        start += size
+
+    times = merged['datetime']
+    if np.any(times[1:] <= times[:-1]):
+        # Overlapping files: sort by time, the later part first within a
+        # timestamp, and keep the first row of each timestamp
+        order = np.lexsort((-np.repeat(ranked, sizes), times))
+        sorted_times = times[order]
+        rows = order[np.concatenate(([True], sorted_times[1:] != sorted_times[:-1]))]
+        merged = {name: values[rows] for name, values in merged.items()}
+    return merged
+
+
+def _sort_rows(columns):
+    """Put rows in time order; the time index relies on it."""
+    times = columns['datetime']
+    if np.any(times[1:] < times[:-1]):
+        order = np.argsort(times, kind='stable')
+        columns = {name: values[order] for name, values in columns.items()}
+    return columns
+
+
+@profiling.profiled('load_dataset')
+def load_dataset(source, workers=None):
+    """Shared, read-only Dataset over the cached columns of ``source``.
+
+    ``source`` is a .dat file, a directory of yearly files or a glob (see
+    ``source_files``). Only files that changed since they were cached are
+    parsed again. A single file stays memory-mapped unless rows have to be
+    reordered; several files are merged into one array per column, and
+    timestamps found in more than one file keep the newest file's row.
+    """
+    paths = source_files(source)
+    if not paths:
+        raise FileNotFoundError(f'No OMNI .dat files match {source}')
+    build_caches(paths, workers)
+    # Oldest first, so overlapping rows come from the newest file
+    newest_last = sorted(paths, key=lambda path: os.stat(path).st_mtime_ns)
+    columns = _sort_rows(merge_columns([load_columns(path) for path in newest_last]))
+    return Dataset(columns, version=source_version(source, paths))
+
+
+def source_version(source, paths=None):
+    """Version of the data behind ``source``; changes whenever a file does."""
+    signatures = [source_signature(path) for path in paths or source_files(source)]
+    return (os.path.abspath(source), sum(sig['size'] for sig in signatures), max(sig['mtime_ns'] for sig in signatures))
+
+
+class TailLoader:
+    """Keeps an append-only .dat file in memory, parsing only the new lines.
+
+    ``refresh()`` remembers the byte offset and the last timestamp it has
+    parsed; later calls read just the bytes appended since then. If the file
+    was replaced (another inode), shrank, changed without growing, or its
+    first bytes or the bytes just before the offset differ, it was rewritten
+    and the whole file is loaded again. Columns live in over-allocated
+    buffers so appends are amortised O(new rows) and the returned Dataset
+    is a read-only view over them.
+    """
+
+    head_size = 256
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.offset = 0
+        # os.stat() taken before the last read, and the bytes _marks() saw
+        self.stat = None
+        self.marks = None
+        self.last_time = None
+        self.rows = 0
+        self.buffers = None
+        # Full loads and appends so far; a dataset with the same path and
+        # reload count as an earlier one extends it
+        self.reloads = 0
+        self.version = 0
+        self.index = None
+        self.dataset = None
+
+    def refresh(self):
+        with self.lock, profiling.stage('tail_refresh') as entry:
+            stat = os.stat(self.path)
+            if self.dataset is None or self._rewritten(stat):
+                self._full_load(stat)
+            elif stat.st_size > self.offset:
+                self._read_tail(stat)
+            if entry is not None:
+                entry['rows'] = self.rows
+
+    def snapshot(self):
+        """Refreshed Dataset; its columns and time index describe the same rows."""
+        with self.lock:
+            self.refresh()
+            return self.dataset
+
+    def _rewritten(self, stat):
+        last = self.stat
+        if stat.st_ino != last.st_ino or stat.st_size < self.offset:
+            return True
+        if stat.st_size == last.st_size and stat.st_mtime_ns != last.st_mtime_ns:
+            # Modified without growing
+            return True
+        return self._marks() != self.marks
+
+    def _marks(self):
+        # The first bytes of the file and those just before ``offset``
+        with open(self.path, 'rb') as f:
+            head = f.read(self.head_size)
+            f.seek(max(0, self.offset - self.head_size))
+            return head, f.read(min(self.offset, self.head_size))
+
+    def _line_end(self, f, start, stop):
+        """Offset just past the last newline in [start, stop), or start if none."""
+        f.seek(start)
+        data = f.read(stop - start)
+        return start + data.rfind(b'\n') + 1
+
+    def _full_load(self, stat):
+        columns = _sort_rows(load_columns(self.path))
+        with open(self.path, 'rb') as f:
+            self.offset = self._line_end(f, max(0, stat.st_size - 4096), stat.st_size)
+        self.stat = stat
+        self.marks = self._marks()
+        self.reloads += 1
+        self.buffers = None
+        self.rows = 0
+        self.last_time = None
+        self.index = None
+        self._append(columns)
+
+    def _read_tail(self, stat):
+        with open(self.path, 'rb') as f:
+            end = self._line_end(f, self.offset, stat.st_size)
+            f.seek(self.offset)
+            chunk = f.read(end - self.offset)
+        self.stat = stat
+        if end == self.offset:
+            return
+        self.offset = end
+        self.marks = self._marks()
+        self._append(parse_dat(io.BytesIO(chunk)))
+
+    def _append(self, columns):
+        if self.last_time is not None:
+            # Lines parsed during the full load may be read again from the tail.
+            keep = columns['datetime'] > self.last_time
+            columns = {name: values[keep] for name, values in columns.items()}
+        n = len(columns['datetime'])
+        if self.buffers is None:
+            self.buffers = {name: np.empty(max(n, 1024), dtype=values.dtype) for name, values in columns.items()}
+        elif self.rows + n > len(self.buffers['datetime']):
+            capacity = max(2 * len(self.buffers['datetime']), self.rows + n)
+            for name, values in self.buffers.items():
+                grown = np.empty(capacity, dtype=values.dtype)
+                grown[:self.rows] = values[:self.rows]
+                self.buffers[name] = grown
+        for name, values in columns.items():
+            self.buffers[name][self.rows:self.rows + n] = values
+        self.rows += n
+        if self.rows:
+            self.last_time = self.buffers['datetime'][self.rows - 1]
+        self.version += 1
+        times = self.buffers['datetime'][:self.rows]
+        self.index = TimeIndex(times) if self.index is None else self.index.extended(times)
+        # Appends only write past ``rows``, so earlier datasets stay valid
+        self.dataset = Dataset({name: values[:self.rows] for name, values in self.buffers.items()},
+                               index=self.index, version=(os.path.abspath(self.path), self.reloads, self.version))
+
+
+@st.cache_resource
+def latest_loader():
+    return TailLoader("latest.dat")
+
+
+def load_latest_dataset():
+    return latest_loader().snapshot()
+
+
+@st.cache_resource
+def latest_rolling():
+    # Rolling windows over latest.dat, extended as the tail loader appends rows
+    return RollingCache()
+
+
+@st.cache_resource
+def load_old_dataset():
+    # One read-only copy per process, shared by every session without pickling
+    return load_dataset(HISTORY_SOURCE)
+
+
+def derived_path(source, name):
+    # Kept beside the cache of the first file; the dataset version saved
+    # with it tells whether it is still current.
+    return os.path.join(cache_path(source_files(source)[0]), name)
+
+
+def forecast_model_path(source):
+    return derived_path(source, 'forecast.npz')
+
+
+def storm_catalog_path(source):
+    return derived_path(source, 'storms.npz')
+
 
+@st.cache_resource
+def load_forecast_model():
+    # Trained once on the history and reloaded from disk on later starts
+    dataset = load_old_dataset()
+    model_path = forecast_model_path(HISTORY_SOURCE)
+    model = forecast.load(model_path, dataset.version)
+    if model is None:
+        model = forecast.train(dataset)
+        forecast.save(model, model_path)
+    return model
 
-@st.cache_data
-def load_data():
 
-    filen = "latest.dat"
-    cols = ['year', 'day', 'hour', 'bartels_rotation', 'id_imf_spacecraft', 'id_sw_plasma_spacecraft', 'n_imf_avg', 'n_plasma_avg', 'field_magnitude_avg', 'magnitude_avg_field_vector', 'lat_angle_avg_field_vector', 'long_angle_avg_field_vector', 'bx_gse', 'by_gse', 'bz_gse', 'by_gsm', 'bz_gsm', 'sigma_field_magnitude', 'sigma_field_vector', 'sigma_bx', 'sigma_by', 'sigma_bz', 'proton_temperature', 'proton_density', 'plasma_speed', 'plasma_flow_long_angle', 'plasma_flow_lat_angle', 'na_np', 'flow_pressure', 'sigma_t', 'sigma_n', 'sigma_v', 'sigma_phi_v', 'sigma_theta_v', 'sigma_na_np', 'electric_field', 'plasma_beta', 'alfven_mach_number', 'kp', 'r', 'dst_index', 'ae_index', 'proton_flux_1', 'proton_flux_2', 'proton_flux_4', 'proton_flux_10', 'proton_flux_30', 'proton_flux_60', 'flag', 'ap_index', 'f10.7_index', 'pc_n_index', 'al_index', 'au_index', 'magnetosonic_mach_number']
+@st.cache_resource
+def load_storm_catalog():
+    # Built once from the history and reloaded from disk on later starts
+    dataset = load_old_dataset()
+    catalog_path = storm_catalog_path(HISTORY_SOURCE)
+    catalog = storms.load(catalog_path, dataset.version)
+    if catalog is None:
+        catalog = storms.build_catalog(dataset)
+        storms.save(catalog, catalog_path)
+    return catalog
 
-    df = pd.read_csv(filen, sep=r'\s+', header=None, names=cols)
-    # df = pd.read_csv('last.csv')
-    df['datetime'] = pd.to_datetime(df['year'].astype(str) + ' ' + df['day'].astype(str) + ' ' + df['hour'].astype(str), format='%Y %j %H')
-    df.dropna(inplace=True)
-    return df
 
-@st.cache_data
-def load_old_data():
-    filen = "here.dat"
-    cols = ['year', 'day', 'hour', 'bartels_rotation', 'id_imf_spacecraft', 'id_sw_plasma_spacecraft', 'n_imf_avg', 'n_plasma_avg', 'field_magnitude_avg', 'magnitude_avg_field_vector', 'lat_angle_avg_field_vector', 'long_angle_avg_field_vector', 'bx_gse', 'by_gse', 'bz_gse', 'by_gsm', 'bz_gsm', 'sigma_field_magnitude', 'sigma_field_vector', 'sigma_bx', 'sigma_by', 'sigma_bz', 'proton_temperature', 'proton_density', 'plasma_speed', 'plasma_flow_long_angle', 'plasma_flow_lat_angle', 'na_np', 'flow_pressure', 'sigma_t', 'sigma_n', 'sigma_v', 'sigma_phi_v', 'sigma_theta_v', 'sigma_na_np', 'electric_field', 'plasma_beta', 'alfven_mach_number', 'kp', 'r', 'dst_index', 'ae_index', 'proton_flux_1', 'proton_flux_2', 'proton_flux_4', 'proton_flux_10', 'proton_flux_30', 'proton_flux_60', 'flag', 'ap_index', 'f10.7_index', 'pc_n_index', 'al_index', 'au_index', 'magnetosonic_mach_number']
+if __name__ == '__main__':
+    # One-time conversion: python -m utils.loader here.dat latest.dat omni/
+    import sys
 
-    df = pd.read_csv(filen, sep=r'\s+', header=None, names=cols)
-    # df = pd.read_csv('last.csv')
-    df['datetime'] = pd.to_datetime(df['year'].astype(str) + ' ' + df['day'].astype(str) + ' ' + df['hour'].astype(str), format='%Y %j %H')
-    df.dropna(inplace=True)
-    return df
+    for source in sys.argv[1:] or [HISTORY_SOURCE, "latest.dat"]:
+        paths = source_files(source)
+        rebuilt = build_caches(paths)
+        print(f'{source}: {len(rebuilt)} of {len(paths)} files re-parsed')
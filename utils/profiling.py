@@ -0,0 +1,148 @@
+"""Opt-in per-rerun stage timing for the Streamlit pages.
+
+Profiling is off unless the ``COSMOS_PROFILE`` environment variable is set
+or the page is opened with ``?profile=1``. While off, ``stage()`` hands back a
+shared no-op context manager after one thread-local lookup, so the hooks
+cost next to nothing. While on, every stage of a rerun records its
+wall time, rows, resident memory delta (where /proc is available) and
+(for charts) the estimated payload size; ``end_run()`` shows them in a
+sidebar panel and appends the rerun to a JSONL log
+(``COSMOS_PROFILE_LOG``, default profile.jsonl).
+"""
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import streamlit as st
+
+ENABLED = os.environ.get('COSMOS_PROFILE', '') not in ('', '0')
+LOG_PATH = os.environ.get('COSMOS_PROFILE_LOG', 'profile.jsonl')
+
+_NULL = contextlib.nullcontext()
+_local = threading.local()
+_log_lock = threading.Lock()
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = None
+
+
+def _rss_bytes():
+    """Current resident set size, or None where /proc isn't available.
+
+    getrusage() only reports the peak, which says nothing about one stage.
+    """
+    if _PAGE_SIZE:
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * _PAGE_SIZE
+        except (OSError, ValueError, IndexError):
+            pass
+    return None
+
+
+def _requested():
+    if ENABLED:
+        return True
+    try:
+        return st.query_params.get('profile') not in (None, '', '0')
+    except Exception:
+        # No script run context, e.g. when imported from a CLI
+        return False
+
+
+def start_run(page):
+    """Begin recording a rerun of ``page`` if profiling is requested."""
+    _local.run = {'page': page, 'started': time.time(), 'stages': []} if _requested() else None
+
+
+def _current():
+    return getattr(_local, 'run', None)
+
+
+@contextlib.contextmanager
+def _record(run, name, rows):
+    entry = {'stage': name}
+    if rows is not None:
+        entry['rows'] = int(rows)
+    rss = _rss_bytes()
+    start = time.perf_counter()
+    try:
+        yield entry
+    finally:
+        entry['seconds'] = round(time.perf_counter() - start, 6)
+        after = _rss_bytes()
+        entry['rss_delta_mb'] = None if rss is None or after is None else round((after - rss) / 2 ** 20, 3)
+        run['stages'].append(entry)
+
+
+def stage(name, rows=None):
+    """Context manager timing one stage; yields a dict for extra fields, or None."""
+    run = _current()
+    if run is None:
+        return _NULL
+    return _record(run, name, rows)
+
+
+def profiled(name=None):
+    """Decorator form of ``stage()``."""
+    def decorate(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# Trace properties that hold the per-point data of a figure
+DATA_PROPERTIES = ('x', 'y', 'z', 'text', 'customdata', 'hovertext')
+
+
+def figure_bytes(fig):
+    """Estimated payload size of ``fig``, read off its trace arrays.
+
+    Serializing the figure only to measure it would cost as much as the
+    serialization ``st.plotly_chart`` does anyway. Numeric arrays are sent
+    base64 encoded; other values count about as much as a JSON timestamp.
+    """
+    size = 0
+    for trace in fig.data:
+        for name in DATA_PROPERTIES:
+            values = trace[name] if name in trace else None
+            if values is None or isinstance(values, str):
+                continue
+            if isinstance(values, np.ndarray) and values.dtype.kind in 'biufc':
+                size += values.nbytes * 4 // 3
+            else:
+                size += 24 * np.size(values)
+    return size
+
+
+def plotly_chart(fig, name, **kwargs):
+    """``st.plotly_chart`` that also records serialization time and payload size."""
+    with stage(f'chart:{name}') as entry:
+        st.plotly_chart(fig, **kwargs)
+    if entry is not None:
+        entry['payload_bytes'] = figure_bytes(fig)
+
+
+def end_run():
+    """Show the recorded stages in the sidebar and append them to the log."""
+    run = _current()
+    _local.run = None
+    if run is None:
+        return
+    run['seconds'] = round(time.time() - run['started'], 6)
+    with st.sidebar.expander('⏱️ Profile', expanded=True):
+        st.write(f"**{run['page']}** rerun took **{run['seconds']:.3f} s**")
+        st.dataframe(run['stages'], use_container_width=True)
+    with _log_lock, open(LOG_PATH, 'a') as f:
+        f.write(json.dumps(run) + '\n')
@@ -0,0 +1,86 @@
+"""Figure cache shared by every session.
+
+Pages look figures up by ``(dataset version, chart, parameter, window,
+resolution)`` and only build them on a miss, so a rerun caused by an
+unrelated widget, or another user on the same view, reuses the figure
+built for the current data. Entries are evicted least recently used first
+once their estimated payload size exceeds the budget (``COSMOS_RENDER_CACHE_MB``,
+default 256).
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import streamlit as st
+
+from utils import profiling
+
+BUDGET = int(float(os.environ.get('COSMOS_RENDER_CACHE_MB', '256')) * 2 ** 20)
+
+
+class FigureCache:
+    """LRU of built Plotly figures bounded by their estimated payload size.
+
+    Cached figures are shared and must not be modified after they are built.
+    """
+
+    def __init__(self, budget=BUDGET):
+        self.budget = budget
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, fig, size):
+        with self._lock:
+            if key in self.entries:
+                self.bytes -= self.entries.pop(key)[1]
+            if size > self.budget:
+                return
+            self.entries[key] = (fig, size)
+            self.bytes += size
+            while self.bytes > self.budget:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.bytes -= evicted
+
+    def figure(self, key, build):
+        """The cached figure for ``key``, built with ``build()`` on a miss.
+
+        ``key`` must describe everything the figure depends on; its second
+        item names the chart in the profile.
+        """
+        fig = self.get(key)
+        if fig is None:
+            # Two sessions may build the same figure at once; the last one wins
+            with profiling.stage(f'figure_build:{key[1]}') as entry:
+                fig = build()
+            size = profiling.figure_bytes(fig)
+            if entry is not None:
+                entry['payload_bytes'] = size
+            self.put(key, fig, size)
+        return fig
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self.entries), 'bytes': self.bytes, 'budget': self.budget,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+@st.cache_resource
+def figure_cache():
+    return FigureCache()
+
+
+def cached_figure(key, build):
+    return figure_cache().figure(key, build)
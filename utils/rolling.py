@@ -0,0 +1,258 @@
+import threading
+from collections import deque
+
+import numpy as np
+
+HOUR = np.timedelta64(1, 'h')
+# Trailing windows offered to the pages, in hours
+WINDOWS = {'3 hours': 3, '1 day': 24, '27 days (Bartels rotation)': 27 * 24}
+STATS = ('count', 'mean', 'std', 'min', 'max')
+
+
+def _hours(dataset):
+    return dataset.derive('hours', lambda: np.asarray(dataset['datetime']).astype('datetime64[h]').astype('int64'))
+
+
+def hourly(dataset, column):
+    """``(first hour, values)`` of ``column`` on a gap-free hourly grid.
+
+    Hours without a row are NaN, like fill values, so ``~np.isnan(values)``
+    is the validity mask. The grid is derived once per dataset and column; a
+    series without gaps is used as is.
+    """
+    hours = _hours(dataset)
+    if not len(hours):
+        return np.datetime64(0, 'h'), np.array([], dtype='float32')
+
+    def grid():
+        values = dataset[column]
+        if dataset.index.contiguous:
+            return values
+        out = np.full(hours[-1] - hours[0] + 1, np.nan, dtype=values.dtype)
+        out[hours - hours[0]] = values
+        return out
+
+    return np.datetime64(int(hours[0]), 'h'), dataset.derive(f'hourly:{column}', grid)
+
+
+def _running(values, window, op, identity):
+    """``op`` (e.g. ``np.minimum`` or ``np.add``) over the trailing ``window``
+    of every position, in O(n) whatever the window (van Herk / Gil-Werman).
+
+    Prefix and suffix scans within blocks of ``window`` give every window as
+    the suffix of one block and the prefix of the next. Sums stay as small as
+    a window, so they don't lose precision the way one long cumulative sum
+    does. The first windows are partial.
+    """
+    n = len(values)
+    blocks = -(-(n + window - 1) // window)
+    padded = np.full(blocks * window, identity, dtype='float64')
+    padded[window - 1:window - 1 + n] = values
+    padded = padded.reshape(blocks, window)
+    prefix = op.accumulate(padded, axis=1).ravel()
+    suffix = op.accumulate(padded[:, ::-1], axis=1)[:, ::-1].ravel()
+    end = np.arange(window - 1, window - 1 + n)
+    first = end - window + 1
+    # A window starting on a block boundary is that whole block
+    return np.where(first % window == 0, suffix[first], op(suffix[first], prefix[end]))
+
+
+def _batch(values, window, shift):
+    """Trailing-window count, sum and sum of squares (of the values minus
+    ``shift``), min and max of every position of ``values``."""
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values - shift, 0.0)
+    count = _running(valid, window, np.add, 0)
+    total = _running(filled, window, np.add, 0)
+    squares = _running(filled * filled, window, np.add, 0)
+    low = _running(np.where(valid, values, np.inf), window, np.minimum, np.inf)
+    high = -_running(np.where(valid, -values, np.inf), window, np.minimum, np.inf)
+    return count, total, squares, low, high
+
+
+class RollingWindow:
+    """Rolling count / mean / std / min / max of one hourly series.
+
+    Every hour gets the statistics of the trailing ``window`` hours ending
+    with it, NaN hours skipped; hours with fewer than ``min_valid`` values
+    are NaN. ``extend()`` appends hours: long runs are computed in one
+    vectorized pass over the new hours plus the previous ``window - 1``,
+    short ones (a live update) step running sums and monotonic deques for
+    the extrema, O(1) amortised per hour. The running sums are rebuilt from
+    the window every ``window`` steps so rounding errors don't accumulate.
+    """
+
+    step_limit = 64
+
+    def __init__(self, window, min_valid=1):
+        self.window = window
+        self.min_valid = min_valid
+        self.start = None
+        self.n = 0
+        self.shift = 0.0
+        # The last ``window`` values, and the running state over them
+        self.recent = deque(maxlen=window)
+        self._sums = None
+        self._low = None
+        self._high = None
+        self._steps = 0
+        self._buffers = {stat: np.empty(0) for stat in STATS}
+
+    def extend(self, values, start=None):
+        """Append the grid ``values`` of the hours following the last one.
+
+        ``start`` is the hour of the first value, needed on the first call.
+        """
+        values = np.asarray(values, dtype='float64')
+        if self.start is None:
+            if start is None:
+                raise ValueError('The first extend() needs the start hour')
+            self.start = np.datetime64(start, 'h')
+            if np.any(~np.isnan(values)):
+                self.shift = float(np.nanmean(values))
+        if not len(values):
+            return
+        if len(values) > self.step_limit:
+            self._extend_batch(values)
+        else:
+            self._extend_steps(values)
+
+    def _store(self, count, total, squares, low, high):
+        n = len(count)
+        if self.n + n > len(self._buffers['count']):
+            capacity = max(2 * len(self._buffers['count']), self.n + n, 1024)
+            for stat, buffer in self._buffers.items():
+                grown = np.empty(capacity)
+                grown[:self.n] = buffer[:self.n]
+                self._buffers[stat] = grown
+        enough = count >= self.min_valid
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / count
+            var = np.maximum(squares / count - mean * mean, 0.0)
+        out = slice(self.n, self.n + n)
+        self._buffers['count'][out] = count
+        self._buffers['mean'][out] = np.where(enough, mean + self.shift, np.nan)
+        self._buffers['std'][out] = np.where(enough, np.sqrt(var), np.nan)
+        self._buffers['min'][out] = np.where(enough, low, np.nan)
+        self._buffers['max'][out] = np.where(enough, high, np.nan)
+        self.n += n
+
+    def _extend_batch(self, values):
+        tail = np.array(self.recent)[-(self.window - 1):] if self.window > 1 else np.array([])
+        count, total, squares, low, high = _batch(np.concatenate((tail, values)), self.window, self.shift)
+        skip = len(tail)
+        self._store(count[skip:], total[skip:], squares[skip:], low[skip:], high[skip:])
+        self.recent.extend(values[-self.window:])
+        # The step state is rebuilt from ``recent`` when next needed
+        self._sums = self._low = self._high = None
+
+    def _rebuild(self):
+        self._steps = 0
+        self._sums = [0, 0.0, 0.0]
+        self._low, self._high = deque(), deque()
+        first = self.n - len(self.recent)
+        for i, x in enumerate(self.recent):
+            self._push(first + i, x)
+
+    def _push(self, pos, x):
+        if x != x:  # NaN
+            return
+        sums = self._sums
+        sums[0] += 1
+        sums[1] += x - self.shift
+        sums[2] += (x - self.shift) ** 2
+        while self._low and self._low[-1][1] >= x:
+            self._low.pop()
+        self._low.append((pos, x))
+        while self._high and self._high[-1][1] <= x:
+            self._high.pop()
+        self._high.append((pos, x))
+
+    def _extend_steps(self, values):
+        if self._sums is None or self._steps >= self.window:
+            self._rebuild()
+        self._steps += len(values)
+        n = len(values)
+        count, total, squares = np.empty(n), np.empty(n), np.empty(n)
+        low, high = np.empty(n), np.empty(n)
+        for i, x in enumerate(values.tolist()):
+            pos = self.n + i
+            if len(self.recent) == self.window:
+                leaving = self.recent[0]
+                if leaving == leaving:
+                    self._sums[0] -= 1
+                    self._sums[1] -= leaving - self.shift
+                    self._sums[2] -= (leaving - self.shift) ** 2
+            self.recent.append(x)
+            self._push(pos, x)
+            for extrema in (self._low, self._high):
+                while extrema and extrema[0][0] <= pos - self.window:
+                    extrema.popleft()
+            count[i], total[i], squares[i] = self._sums
+            low[i] = self._low[0][1] if self._low else np.inf
+            high[i] = self._high[0][1] if self._high else -np.inf
+        self._store(count, total, squares, low, high)
+
+    def values(self, stat='mean'):
+        """Per-hour ``stat`` over the whole grid (a view)."""
+        return self._buffers[stat][:self.n]
+
+    def times(self, hours=slice(None)):
+        """Timestamps of the grid hours in the ``hours`` slice."""
+        if self.start is None:
+            return np.array([], dtype='datetime64[ns]')
+        return (self.start + np.arange(*hours.indices(self.n)) * HOUR).astype('datetime64[ns]')
+
+    def slice(self, start=None, end=None):
+        """Grid slice of the hours with ``start <= hour <= end``."""
+        if self.start is None:
+            return slice(0, 0)
+        lo = 0 if start is None else int(np.ceil((np.datetime64(start, 'ns') - self.start) / HOUR))
+        hi = self.n if end is None else int(np.floor((np.datetime64(end, 'ns') - self.start) / HOUR)) + 1
+        lo, hi = min(max(lo, 0), self.n), min(max(hi, 0), self.n)
+        return slice(lo, max(lo, hi))
+
+
+class RollingCache:
+    """RollingWindow per (column, window) following one TailLoader's dataset.
+
+    ``get()`` with a newer version of the dataset (more rows appended)
+    extends the cached windows with the new hours only; any other change
+    rebuilds them. Versions are TailLoader's ``(path, reloads, appends)``,
+    and only a dataset of the same path and reload extends an entry, since
+    a reload may have revised rows already seen.
+    """
+
+    def __init__(self, min_valid=1):
+        self.min_valid = min_valid
+        self.entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, dataset, column, window):
+        with self._lock:
+            key = (column, window)
+            entry = self.entries.get(key)
+            times = dataset['datetime']
+            base = None if dataset.version is None else dataset.version[:2]
+            if entry is None or not self._extends(entry, base, times):
+                rolling = RollingWindow(window, self.min_valid)
+                start, grid = hourly(dataset, column)
+                rolling.extend(grid, start)
+            else:
+                rolling, rows, _, _ = entry
+                new = slice(rows, len(times))
+                hours = (times[new].astype('datetime64[h]') - rolling.start).astype('int64')
+                if len(hours):
+                    grid = np.full(hours[-1] + 1 - rolling.n, np.nan)
+                    grid[hours - rolling.n] = dataset[column][new]
+                    rolling.extend(grid)
+            self.entries[key] = (rolling, len(times), times[-1] if len(times) else None, base)
+            return rolling
+
+    @staticmethod
+    def _extends(entry, base, times):
+        rolling, rows, last, built_from = entry
+        return (base is not None and base == built_from
+                and rolling.start is not None and rows <= len(times) and rows > 0
+                and times[0].astype('datetime64[h]') == rolling.start and times[rows - 1] == last)
+
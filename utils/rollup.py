@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+
+# Rollup levels and the numpy datetime unit each one buckets on
+LEVELS = {'day': 'D', 'month': 'M', 'year': 'Y'}
+STATS = ('count', 'sum', 'sumsq', 'min', 'max')
+
+
+def _bucket_starts(keys):
+    return np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+
+
+def _aggregate(keys, columns, order=None):
+    """Aggregate sorted ``keys`` and the 1D ``columns`` rows into per-key statistics.
+
+    Columns are aggregated one at a time, rows reordered by ``order`` first
+    if given, so only one column's float64 temporaries are alive at once.
+    """
+    starts = _bucket_starts(keys)
+    stats = {stat: np.empty((len(starts), len(columns)), dtype='int64' if stat == 'count' else 'float64') for stat in STATS}
+    for i, column in enumerate(columns):
+        values = np.asarray(column, dtype='float64')
+        if order is not None:
+            values = values[order]
+        valid = ~np.isnan(values)
+        filled = np.where(valid, values, 0.0)
+        stats['count'][:, i] = np.add.reduceat(valid, starts, dtype='int64')
+        stats['sum'][:, i] = np.add.reduceat(filled, starts)
+        stats['sumsq'][:, i] = np.add.reduceat(filled * filled, starts)
+        stats['min'][:, i] = np.minimum.reduceat(np.where(valid, values, np.inf), starts)
+        stats['max'][:, i] = np.maximum.reduceat(np.where(valid, values, -np.inf), starts)
+    return keys[starts], stats
+
+
+def _reaggregate(keys, stats):
+    """Roll finer bucket statistics up into coarser sorted ``keys``."""
+    starts = _bucket_starts(keys)
+    return keys[starts], {
+        'count': np.add.reduceat(stats['count'], starts, axis=0),
+        'sum': np.add.reduceat(stats['sum'], starts, axis=0),
+        'sumsq': np.add.reduceat(stats['sumsq'], starts, axis=0),
+        'min': np.minimum.reduceat(stats['min'], starts, axis=0),
+        'max': np.maximum.reduceat(stats['max'], starts, axis=0),
+    }
+
+
+def _merge(a, b):
+    """Combine the statistics of two partial aggregates of the same bucket."""
+    return {
+        'count': a['count'] + b['count'],
+        'sum': a['sum'] + b['sum'],
+        'sumsq': a['sumsq'] + b['sumsq'],
+        'min': np.minimum(a['min'], b['min']),
+        'max': np.maximum(a['max'], b['max']),
+    }
+
+
+class Rollup:
+    """Daily, monthly and yearly aggregates of hourly columns.
+
+    Every level stores count, sum, sum of squares, min and max per bucket and
+    column, so means and standard deviations are lookups instead of groupbys
+    over the hourly rows. ``extend()`` folds newly arrived rows into the
+    existing buckets.
+    """
+
+    def __init__(self, times, columns):
+        self.columns = list(columns)
+        self.keys = {}
+        self.stats = {}
+        for level, unit in LEVELS.items():
+            self.keys[level] = np.array([], dtype=f'datetime64[{unit}]')
+            self.stats[level] = {stat: np.empty((0, len(self.columns)), dtype='int64' if stat == 'count' else 'float64') for stat in STATS}
+        self.extend(times, columns)
+
+    def extend(self, times, columns):
+        times = np.asarray(times, dtype='datetime64[ns]')
+        if not len(times):
+            return
+        order = None
+        if np.any(times[1:] < times[:-1]):
+            order = np.argsort(times, kind='stable')
+            times = times[order]
+
+        # Only the daily level touches the hourly rows; coarser levels are
+        # built from the daily buckets.
+        keys, stats = None, None
+        for level, unit in LEVELS.items():
+            if keys is None:
+                keys, stats = _aggregate(times.astype(f'datetime64[{unit}]'), [columns[name] for name in self.columns], order)
+            else:
+                keys, stats = _reaggregate(keys.astype(f'datetime64[{unit}]'), stats)
+            new_keys, new_stats = keys, stats
+            old_keys, old_stats = self.keys[level], self.stats[level]
+            if len(old_keys) and new_keys[0] <= old_keys[-1]:
+                if new_keys[0] < old_keys[-1]:
+                    raise ValueError('Rollup.extend() expects rows after the ones already aggregated')
+                last = _merge({s: v[-1] for s, v in old_stats.items()}, {s: v[0] for s, v in new_stats.items()})
+                for stat in STATS:
+                    old_stats[stat][-1] = last[stat]
+                new_keys = new_keys[1:]
+                new_stats = {s: v[1:] for s, v in new_stats.items()}
+            self.keys[level] = np.concatenate((old_keys, new_keys))
+            self.stats[level] = {s: np.concatenate((old_stats[s], new_stats[s])) for s in STATS}
+
+    def values(self, level, column, stat='mean'):
+        """Per-bucket ``stat`` of ``column``: count, sum, sumsq, min, max, mean or std."""
+        stats = self.stats[level]
+        i = self.columns.index(column)
+        count = stats['count'][:, i]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if stat == 'mean':
+                return np.where(count > 0, stats['sum'][:, i] / count, np.nan)
+            if stat == 'std':
+                mean = stats['sum'][:, i] / count
+                var = np.maximum(stats['sumsq'][:, i] / count - mean * mean, 0.0)
+                return np.where(count > 0, np.sqrt(var), np.nan)
+        if stat in ('min', 'max'):
+            return np.where(count > 0, stats[stat][:, i], np.nan)
+        return stats[stat][:, i]
+
+    def frame(self, level, column, stat='mean', start=None, end=None):
+        """Bucket table with year / month / day key columns and ``column`` values.
+
+        ``start`` / ``end`` restrict the buckets to a (half-open) time range.
+        """
+        keys = self.keys[level]
+        lo = 0 if start is None else np.searchsorted(keys, np.datetime64(start, LEVELS[level]))
+        hi = len(keys) if end is None else np.searchsorted(keys, np.datetime64(end, LEVELS[level]))
+        keys = keys[lo:hi]
+        df = pd.DataFrame({'year': keys.astype('datetime64[Y]').astype('int64') + 1970})
+        if level in ('month', 'day'):
+            df['month'] = keys.astype('datetime64[M]').astype('int64') % 12 + 1
+        if level == 'day':
+            df['day'] = (keys - keys.astype('datetime64[M]')).astype('int64') + 1
+        df[column] = self.values(level, column, stat)[lo:hi]
+        return df
+
+    def years(self):
+        return (self.keys['year'].astype('int64') + 1970).tolist()
@@ -0,0 +1,145 @@
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils.rolling import hourly
+
+# Dst (nT) a minimum has to reach to count as a storm
+THRESHOLD = -50
+# A storm minimum is the lowest Dst within this many hours either side, which
+# also keeps catalogued minima at least this far apart
+SEPARATION = 72
+# Hours before the minimum searched for the onset, the last Dst maximum
+MAIN_MAX = 48
+# Recovery ends once Dst is back above this fraction of the minimum, or
+# after RECOVERY_MAX hours
+RECOVERED = 0.25
+RECOVERY_MAX = 7 * 24
+# Dst minimum (nT) at or below which a storm gets each label
+INTENSITY = ((-250, 'severe'), (-100, 'intense'), (THRESHOLD, 'moderate'))
+
+HOUR = np.timedelta64(1, 'h')
+FIELDS = ('onset', 'minimum', 'recovery_end', 'dst_min', 'kp_max')
+
+
+def _gather(values, starts, width):
+    """``(len(starts), width)`` windows of ``values`` from ``starts``, NaN outside it."""
+    pad = np.full(width, np.nan, dtype=values.dtype)
+    windows = sliding_window_view(np.concatenate((pad, values, pad)), width)
+    return windows[np.asarray(starts) + width]
+
+
+def _empty():
+    times = np.array([], dtype='datetime64[ns]')
+    nan = np.array([], dtype='float32')
+    return {'onset': times, 'minimum': times, 'recovery_end': times, 'dst_min': nan, 'kp_max': nan}
+
+
+def build_catalog(dataset):
+    """Catalogue every storm in ``dataset`` from its Dst minima.
+
+    A storm is an hour whose Dst is at most THRESHOLD and the lowest within
+    SEPARATION hours either side, found with one rolling minimum over the
+    hourly grid. Its main phase runs from the onset (the highest Dst in the
+    MAIN_MAX hours before) to the minimum, and its recovery until Dst is back
+    above RECOVERED times the minimum. ``kp_max`` is the peak Kp over the
+    whole storm (OMNI stores Kp × 10; the catalog doesn't).
+    """
+    start, dst = hourly(dataset, 'dst_index')
+    catalog = _empty()
+    if len(dst):
+        valid = np.where(np.isnan(dst), np.inf, dst).astype('float64')
+        edge = np.full(SEPARATION, np.inf)
+        rolling_min = sliding_window_view(np.concatenate((edge, valid, edge)), 2 * SEPARATION + 1).min(axis=1)
+        peaks = np.flatnonzero((valid <= THRESHOLD) & (valid == rolling_min))
+        # Equal minima of one storm: keep the first
+        peaks = peaks[np.concatenate(([True], np.diff(peaks) > SEPARATION))] if len(peaks) else peaks
+
+        dst_min = dst[peaks]
+        onsets = peaks - MAIN_MAX + np.nanargmax(_gather(dst, peaks - MAIN_MAX, MAIN_MAX + 1), axis=1)
+        with np.errstate(invalid='ignore'):
+            recovered = _gather(dst, peaks, RECOVERY_MAX + 1) >= RECOVERED * dst_min[:, None]
+        ends = peaks + np.where(recovered.any(axis=1), recovered.argmax(axis=1), RECOVERY_MAX)
+
+        _, kp = hourly(dataset, 'kp')
+        width = MAIN_MAX + RECOVERY_MAX + 1
+        inside = np.arange(width) <= (ends - onsets)[:, None]
+        kp_window = _gather(kp, onsets, width)
+        # Missing Kp hours don't count; a storm without any Kp gets NaN
+        kp_max = np.where(inside & ~np.isnan(kp_window), kp_window, -np.inf).max(axis=1)
+        kp_max = np.where(np.isfinite(kp_max), kp_max / 10, np.nan)
+
+        def to_time(rows):
+            return (start + rows * HOUR).astype('datetime64[ns]')
+
+        catalog = {'onset': to_time(onsets), 'minimum': to_time(peaks), 'recovery_end': to_time(ends),
+                   'dst_min': dst_min.astype('float32'), 'kp_max': kp_max.astype('float32')}
+    catalog['version'] = str(dataset.version)
+    return catalog
+
+
+def intensity(dst_min):
+    """moderate / intense / severe label of every Dst minimum."""
+    dst_min = np.asarray(dst_min)
+    return np.select([dst_min <= level for level, _ in INTENSITY], [label for _, label in INTENSITY], '')
+
+
+def catalog_frame(catalog):
+    """The catalog as a DataFrame, one storm per row."""
+    return pd.DataFrame({
+        'onset': catalog['onset'],
+        'dst_minimum_time': catalog['minimum'],
+        'recovery_end': catalog['recovery_end'],
+        'dst_min': catalog['dst_min'],
+        'kp_max': catalog['kp_max'],
+        'main_phase_hours': (catalog['minimum'] - catalog['onset']) // HOUR,
+        'recovery_hours': (catalog['recovery_end'] - catalog['minimum']) // HOUR,
+        'intensity': intensity(catalog['dst_min']),
+    })
+
+
+def superposed_epoch(dataset, column, epochs, days=3, quantiles=(0.25, 0.75)):
+    """Stack ``column`` within ±``days`` of every epoch and reduce across events.
+
+    The windows come out of the hourly grid in one strided gather, so
+    hundreds of events cost a single ``(events, hours)`` copy. Returns the
+    lag in hours, the median and ``quantiles`` at each lag, and how many
+    events had data there.
+    """
+    start, grid = hourly(dataset, column)
+    before = int(days * 24)
+    offsets = (np.asarray(epochs, dtype='datetime64[h]') - start).astype('int64')
+    # Epochs whose whole window lies outside the data add nothing
+    offsets = offsets[(offsets + before >= 0) & (offsets - before < len(grid))]
+    stack = _gather(grid, offsets - before, 2 * before + 1).astype('float64')
+    with warnings.catch_warnings():
+        # Lags where no event has data are NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        median = np.nanmedian(stack, axis=0)
+        bands = np.nanquantile(stack, quantiles, axis=0) if len(stack) else np.full((len(quantiles), stack.shape[1]), np.nan)
+    return {'lag_hours': np.arange(-before, before + 1), 'median': median,
+            'quantiles': dict(zip(quantiles, bands)), 'count': (~np.isnan(stack)).sum(axis=0), 'events': len(stack)}
+
+
+def save(catalog, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + '.tmp.npz'
+    np.savez(tmp, **catalog)
+    os.replace(tmp, path)
+
+
+def load(path, version=None):
+    """Load a saved catalog, or None if it is missing or built from other data."""
+    try:
+        with np.load(path) as f:
+            catalog = {name: f[name] for name in f.files}
+    except (OSError, ValueError):
+        return None
+    if any(name not in catalog for name in FIELDS):
+        return None
+    if version is not None and str(catalog.get('version')) != str(version):
+        return None
+    return catalog
@@ -0,0 +1,68 @@
+import numpy as np
+
+HOUR = np.timedelta64(1, 'h')
+
+
+def _to_ns(t):
+    return np.datetime64(t, 'ns')
+
+
+class TimeIndex:
+    """Sorted hourly time index resolving time windows to row slices.
+
+    ``times`` must be sorted, unique datetime64[ns] values on whole hours, as
+    produced by the loader. The index keeps a view of them, never a copy.
+    While the series has no missing hours a row position is computed directly
+    from the timestamp; otherwise the lookup is narrowed to the year/month
+    partition holding it and finished with ``searchsorted``.
+    """
+
+    def __init__(self, times, _checked=0):
+        times = np.asarray(times)
+        if times.dtype != 'datetime64[ns]':
+            times = times.astype('datetime64[ns]')
+        self.times = times
+        # The first ``_checked`` rows are already known to be sorted
+        tail = times[max(_checked - 1, 0):]
+        if np.any(tail[1:] <= tail[:-1]):
+            raise ValueError('TimeIndex needs sorted, unique timestamps')
+        n = len(times)
+        self.contiguous = n > 0 and times[-1] - times[0] == (n - 1) * HOUR
+
+        # Partition directory: the row offsets at which every month starts
+        if n:
+            first, last = times[[0, -1]].astype('datetime64[M]')
+            self.months = np.arange(first, last + 1)
+        else:
+            self.months = np.array([], dtype='datetime64[M]')
+        self.offsets = np.concatenate((np.searchsorted(times, self.months.astype('datetime64[ns]')), [n]))
+
+    def __len__(self):
+        return len(self.times)
+
+    def extended(self, times):
+        """A new index over ``times``, which extends the timestamps of this one."""
+        return TimeIndex(times, _checked=len(self.times))
+
+    def position(self, t, side='left'):
+        """Row position of ``t`` with ``searchsorted`` semantics."""
+        t = _to_ns(t)
+        n = len(self.times)
+        if not n:
+            return 0
+        if self.contiguous:
+            steps = (t - self.times[0]) / HOUR
+            pos = np.ceil(steps) if side == 'left' else np.floor(steps) + 1
+            return int(min(max(pos, 0), n))
+        i = np.searchsorted(self.months, t.astype('datetime64[M]'))
+        if i >= len(self.months):
+            return n
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        return int(lo + np.searchsorted(self.times[lo:hi], t, side=side))
+
+    def slice(self, start=None, end=None):
+        """Row slice of the rows with ``start <= time <= end``."""
+        lo = 0 if start is None else self.position(start, 'left')
+        hi = len(self.times) if end is None else self.position(end, 'right')
+        return slice(lo, max(lo, hi))
+